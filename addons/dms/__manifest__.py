@@ -28,12 +28,14 @@
         "template/portal.xml",
         # Data
         "data/onboarding_data.xml",
+        "data/ir_cron.xml",
         # Views
         "views/dms_tag.xml",
         "views/dms_category.xml",
         "views/dms_file.xml",
         "views/dms_directory.xml",
         "views/storage.xml",
+        "views/storage_migration.xml",
         "views/dms_access_groups_views.xml",
         "views/res_config_settings.xml",
         "views/menu.xml",
@@ -55,6 +57,7 @@
         ],
         "web.assets_frontend": [
             "dms/static/src/scss/portal.scss",
+            "dms/static/src/js/portal/load_more.esm.js",
         ],
         "web.assets_tests": [
             "dms/static/tests/tours/**/*",
@@ -1,16 +1,23 @@
 # Copyright 2020-2021 Tecnativa - Víctor Martínez
 # Copyright 2024 Subteno - Timothée VANNIER (https://www.subteno.com).
 # License LGPL-3.0 or later (https://www.gnu.org/licenses/lgpl).
-import base64
 from typing import Optional  # noqa # pylint: disable=unused-import
 
+from werkzeug.urls import url_encode
+from werkzeug.wsgi import wrap_file
+
 from odoo import _, http
-from odoo.http import content_disposition, request
-from odoo.osv.expression import OR
+from odoo.http import Response, content_disposition, request
+from odoo.osv.expression import AND, FALSE_DOMAIN
 
 from odoo.addons.portal.controllers.portal import CustomerPortal
 from odoo.addons.web.controllers.utils import ensure_db
 
+from ..tools.stream import CHUNK_SIZE
+
+# Number of directories and files rendered per portal page
+PORTAL_PAGE_SIZE = 80
+
 
 class CustomerPortal(CustomerPortal):
     def _dms_check_access(self, model, res_id, access_token=None):
@@ -42,7 +49,13 @@ class CustomerPortal(CustomerPortal):
 
     @http.route(["/my/dms"], type="http", auth="user", website=True)
     def portal_my_dms(
-        self, sortby=None, filterby=None, search=None, search_in="name", **kw
+        self,
+        sortby=None,
+        filterby=None,
+        search=None,
+        search_in="name",
+        after=None,
+        **kw,
     ):
         """
         Display the main page for the DMS module.
@@ -51,6 +64,7 @@ class CustomerPortal(CustomerPortal):
         :param Optional[str] filterby: The field to filter by
         :param Optional[str] search: The search term
         :param Optional[str] search_in: The field to search in
+        :param Optional[str] after: The cursor of the last item of the previous page
 
         :return: response
         :rtype: odoo.http.Response
@@ -63,24 +77,21 @@ class CustomerPortal(CustomerPortal):
             sort_order,
             sortby,
         ) = self._searchbar_data(filterby, sortby)
-        # domain
-        domain = [
-            ("id", "in", request.env["dms.directory"]._get_own_root_directories()),
-        ]
-        # search
-        if search and search_in == "name":
-            domain += OR([[], [("name", "ilike", search)]])
         # content according to pager and archive selected
-        items = request.env["dms.directory"].search(domain, order=sort_order)
-        request.session["my_dms_folder_history"] = items.ids
+        items, next_cursor = self._dms_page(
+            [self._get_root_directories_search(search, search_in)], sort_order, after
+        )
         # values
         values.update(
             {
-                "dms_directories": items,
+                "dms_directories": items[0],
+                "dms_next_cursor": next_cursor,
+                "dms_query": self._dms_query(None, search, search_in, sortby),
                 "page_name": "dms_directory",
                 "default_url": "/my/dms",
                 "searchbar_sortings": searchbar_sortings,
                 "searchbar_inputs": searchbar_inputs,
+                "search": search,
                 "search_in": search_in,
                 "sortby": sortby,
                 "filterby": filterby,
@@ -103,17 +114,22 @@ class CustomerPortal(CustomerPortal):
         search=None,
         search_in="name",
         access_token=None,
+        after=None,
         **kw,
     ):
         """
         Display the content of a directory.
 
+        Subdirectories and then files are listed by pages, the next page starting
+        after the cursor of the last item of the previous one.
+
         :param Optional[int] dms_directory_id: dms_directory_id
         :param Optional[str] sortby: sortby
         :param Optional[str] filterby: filterby
         :param Optional[str] search: search
         :param Optional[str] search_in: search_in
         :param Optional[str] access_token: access_token
+        :param Optional[str] after: The cursor of the last item of the previous page
 
         :return: response
         :rtype: odoo.http.Response
@@ -127,16 +143,17 @@ class CustomerPortal(CustomerPortal):
             sort_order,
             sortby,
         ) = self._searchbar_data(filterby, sortby)
-        dms_directory_items, res = self._get_directories(
-            access_token, dms_directory_id, search, search_in, sort_order
-        )
+        res = self._dms_check_access("dms.directory", dms_directory_id, access_token)
         if not res:
             return request.redirect("/" if access_token else "/my")
 
         dms_directory_sudo = res
-        # dms_files_count
-        dms_file_items = self._get_files(
-            access_token, dms_directory_id, search, search_in, sort_order
+        (dms_directory_items, dms_file_items), next_cursor = self._dms_page(
+            self._get_directory_searches(
+                access_token, dms_directory_id, search, search_in
+            ),
+            sort_order,
+            after,
         )
 
         dms_parent_categories = dms_directory_sudo.sudo()._get_parent_categories(
@@ -149,31 +166,133 @@ class CustomerPortal(CustomerPortal):
             "default_url": "/my/dms",
             "searchbar_sortings": searchbar_sortings,
             "searchbar_inputs": searchbar_inputs,
+            "search": search,
             "search_in": search_in,
             "sortby": sortby,
             "filterby": filterby,
             "access_token": access_token,
             "dms_directory": dms_directory_sudo,
             "dms_files": dms_file_items,
+            "dms_next_cursor": next_cursor,
+            "dms_query": self._dms_query(access_token, search, search_in, sortby),
             "dms_parent_categories": dms_parent_categories,
         }
         return request.render("dms.portal_my_dms", values)
 
-    def _get_files(self, access_token, dms_directory_id, search, search_in, sort_br):
+    @http.route(["/my/dms/load_more"], type="json", auth="public", website=True)
+    def portal_my_dms_load_more(
+        self,
+        after,
+        dms_directory_id=None,
+        access_token=None,
+        search=None,
+        search_in="name",
+        sortby=None,
+        **kw,
+    ):
         """
-        Get files from dms_directory_id
+        Render the rows of the page following the given cursor, to append them
+        to the rows already displayed.
+
+        :param str after: The cursor of the last item of the previous page
+        :param Optional[int] dms_directory_id: The directory listed, or none for
+        the root directories of the user
+        :param Optional[str] access_token: access_token
+        :param Optional[str] search: search
+        :param Optional[str] search_in: search_in
+        :param Optional[str] sortby: sortby
+
+        :return: The rendered rows, and the cursor of the next page
+        :rtype: dict
+        """
+        searchbar_sortings = self._searchbar_data(None, None)[2]
+        sortby = sortby if sortby in searchbar_sortings else None
+        __, __, __, sort_order, sortby = self._searchbar_data(None, sortby)
+        empty = {"html": "", "next_cursor": None}
+        if dms_directory_id:
+            dms_directory_id = int(dms_directory_id)
+            if not self._dms_check_access(
+                "dms.directory", dms_directory_id, access_token
+            ):
+                return empty
+            searches = self._get_directory_searches(
+                access_token, dms_directory_id, search, search_in
+            )
+        elif not request.env.user._is_public():
+            searches = [
+                self._get_root_directories_search(search, search_in),
+                (request.env["dms.file"], FALSE_DOMAIN),
+            ]
+        else:
+            return empty
+        # Unlike a page, an invalid cursor must not append the first page again
+        if not self._dms_parse_cursor(searches, after)[1]:
+            return empty
+        (directories, files), next_cursor = self._dms_page(searches, sort_order, after)
+        html = request.env["ir.ui.view"]._render_template(
+            "dms.portal_my_dms_rows",
+            {
+                "dms_directories": directories,
+                "dms_files": files,
+                "access_token": access_token,
+                "dms_query": self._dms_query(access_token, search, search_in, sortby),
+            },
+        )
+        return {"html": str(html), "next_cursor": next_cursor}
+
+    def _dms_query(self, access_token, search, search_in, sortby):
+        """Query string kept by the links of the listed directories and files."""
+        params = {
+            "access_token": access_token,
+            "search": search,
+            "search_in": search and search_in,
+            "sortby": sortby,
+        }
+        return url_encode({key: value for key, value in params.items() if value})
+
+    def _get_root_directories_search(self, search, search_in):
+        """
+        Get the model and the domain to search the root directories of the user
+
+        :param Optional[str] search: search
+        :param Optional[str] search_in: search_in
+
+        :return: directory_model, domain
+        :rtype: tuple[odoo.model.dms_directory, list]
+        """
+        directory_model = request.env["dms.directory"]
+        domain = [("id", "in", directory_model._get_own_root_directories())]
+        if search and search_in == "name":
+            domain.append(("name", "ilike", search))
+        return directory_model, domain
+
+    def _get_directory_searches(
+        self, access_token, dms_directory_id, search, search_in
+    ):
+        """Get the searches listing the subdirectories and then the files of a
+        directory."""
+        return [
+            self._get_directories_search(
+                access_token, dms_directory_id, search, search_in
+            ),
+            self._get_files_search(access_token, dms_directory_id, search, search_in),
+        ]
+
+    def _get_files_search(self, access_token, dms_directory_id, search, search_in):
+        """
+        Get the model and the domain to search files from dms_directory_id
 
         :param Optional[str] access_token: access_token
         :param int dms_directory_id: dms_directory_id
         :param Optional[str] search: search
         :param Optional[str] search_in: search_in
-        :param str sort_br: sort_br
 
-        :return: dms_file_items
-        :rtype: odoo.model.dms_file
+        :return: file_model, file_domain
+        :rtype: tuple[odoo.model.dms_file, list]
         """
+        file_model = request.env["dms.file"]
         if not dms_directory_id:
-            return request.env["dms.file"]
+            return file_model, FALSE_DOMAIN
         file_domain = [
             ("is_hidden", "=", False),
             ("directory_id", "=", dms_directory_id),
@@ -183,27 +302,27 @@ class CustomerPortal(CustomerPortal):
             file_domain.append(("name", "ilike", search))
 
         # items
-        file_model = request.env["dms.file"]
-        is_access_token_valid = file_model.check_access_token(access_token)
+        is_access_token_valid = (
+            request.env["dms.directory"]
+            .browse(dms_directory_id)
+            .check_access_token(access_token)
+        )
         file_model = file_model.sudo() if is_access_token_valid else file_model
-        dms_file_items = file_model.search(file_domain, order=sort_br)
-        request.session["my_dms_file_history"] = dms_file_items.ids
-        return dms_file_items
+        return file_model, file_domain
 
-    def _get_directories(
-        self, access_token, dms_directory_id, search, search_in, sort_order
+    def _get_directories_search(
+        self, access_token, dms_directory_id, search, search_in
     ):
         """
-        Get directories from dms_directory_id
+        Get the model and the domain to search directories from dms_directory_id
 
         :param Optional[str] access_token: access_token
         :param int dms_directory_id: dms_directory_id
         :param Optional[str] search: search
         :param Optional[str] search_in: search_in
-        :param str sort_order: sort_br
 
-        :return: dms_directory_items, res
-        :rtype: tuple[odoo.model.dms_directory, bool|odoo.model.dms_directory]
+        :return: directory_model, domain
+        :rtype: tuple[odoo.model.dms_directory, list]
         """
         # domain
         domain = [("is_hidden", "=", False), ("parent_id", "=", dms_directory_id)]
@@ -211,18 +330,98 @@ class CustomerPortal(CustomerPortal):
         if search and search_in:
             domain.append(("name", "ilike", search))
 
-        # content according to pager and archive selected
         directory_model = request.env["dms.directory"]
         directory_to_check = directory_model.browse(dms_directory_id)
         is_access_token_valid = directory_to_check.check_access_token(access_token)
         directory_model = (
             directory_model.sudo() if is_access_token_valid else directory_model
         )
-        dms_directory_items = directory_model.search(domain, order=sort_order)
+        return directory_model, domain
 
-        request.session["my_dms_folder_history"] = dms_directory_items.ids
-        res = self._dms_check_access("dms.directory", dms_directory_id, access_token)
-        return dms_directory_items, res
+    def _dms_page(self, searches, order, after=None, limit=None):
+        """
+        Get a page of records, listing the records of each search in turn.
+
+        Pages are delimited with keyset pagination: instead of an offset, the
+        cursor of the last record of the previous page tells where the page
+        starts, so the cost of a page does not depend on its position.
+
+        :param list searches: The models and the domains to search, in order.
+        :param str order: The order of the records, on a single field.
+        :param Optional[str] after: The cursor of the last item of the previous
+        page, as "<search index>-<record id>".
+        :param Optional[int] limit: The number of records of a page.
+
+        :return: The records of each search, and the cursor of the next page
+        :rtype: tuple[list, Optional[str]]
+        """
+        limit = limit or PORTAL_PAGE_SIZE
+        start, after_id = self._dms_parse_cursor(searches, after)
+        pages = []
+        last_cursor = next_cursor = None
+        for index, (model, domain) in enumerate(searches):
+            if index < start or next_cursor:
+                pages.append(model.browse())
+                continue
+            if index == start and after_id:
+                after_record = model.browse(after_id)
+                domain = AND([domain, self._dms_keyset_domain(order, after_record)])
+            # One more record tells whether there is a next page
+            records = model.search(
+                domain, order=self._dms_keyset_order(order), limit=limit + 1
+            )
+            has_more = len(records) > limit
+            records = records[:limit]
+            if records:
+                last_cursor = f"{index}-{records[-1].id}"
+            if has_more:
+                next_cursor = last_cursor
+            pages.append(records)
+            limit -= len(records)
+        return pages, next_cursor
+
+    def _dms_parse_cursor(self, searches, after):
+        """
+        Parse the cursor of a page. A malformed cursor, or a cursor whose record
+        does not exist or is not listed for the user, is ignored: the listing
+        starts again from the first page.
+
+        :param list searches: The models and the domains to search, in order.
+        :param Optional[str] after: The cursor.
+
+        :return: The index of the search and the id of the record of the cursor.
+        :rtype: tuple[int, Optional[int]]
+        """
+        if not after:
+            return 0, None
+        try:
+            start, after_id = (int(part) for part in after.split("-", 1))
+        except ValueError:
+            return 0, None
+        if not 0 <= start < len(searches):
+            return 0, None
+        model, domain = searches[start]
+        # Searched with the access rules of the listing, unlike a browse
+        if not model.search_count(AND([domain, [("id", "=", after_id)]]), limit=1):
+            return 0, None
+        return start, after_id
+
+    def _dms_keyset_order(self, order):
+        field, direction = (order.split() + ["asc"])[:2]
+        return f"{field} {direction}, id {direction}"
+
+    def _dms_keyset_domain(self, order, record):
+        """Domain of the records following the given record in the order."""
+        field, direction = (order.split() + ["asc"])[:2]
+        operator = ">" if direction.lower() == "asc" else "<"
+        value = record[field]
+        return [
+            "|",
+            (field, operator, value),
+            "&",
+            (field, "=", value),
+            ("id", operator, record.id),
+        ]
 
     def _searchbar_data(self, filterby, sortby):
         """
@@ -279,10 +478,34 @@ class CustomerPortal(CustomerPortal):
 
         if res.attachment_id and request.env.user.has_group("base.group_portal"):
             res = res.sudo()
-        file_content = base64.b64decode(res.content)
-        content_type = ("Content-Type", "application/octet-stream")
-        disposition_content = (
-            "Content-Disposition",
-            content_disposition(res.name),
+        return self._dms_file_stream_response(res)
+
+    def _dms_file_stream_response(self, dms_file):
+        """
+        Stream the content of a file in chunks, without loading it in memory.
+
+        Range requests are supported, as well as conditional requests based on the
+        checksum of the file used as ETag.
+
+        :param odoo.model.dms_file dms_file: The file to download.
+
+        :return: response
+        :rtype: odoo.http.Response
+        """
+        environ = request.httprequest.environ
+        reader, size = dms_file._get_content_reader()
+        response = Response(
+            wrap_file(environ, reader, buffer_size=CHUNK_SIZE),
+            headers=[
+                ("Content-Type", "application/octet-stream"),
+                ("Content-Disposition", content_disposition(dms_file.name)),
+            ],
+            direct_passthrough=True,
+        )
+        response.content_length = size
+        etag = dms_file.checksum or dms_file._get_content_attachment().checksum
+        if etag:
+            response.set_etag(etag)
+        return response.make_conditional(
+            environ, accept_ranges=True, complete_length=size
         )
-        return request.make_response(file_content, [content_type, disposition_content])
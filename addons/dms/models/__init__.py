@@ -8,8 +8,11 @@ from . import dms_security_mixin
 from . import abstract_dms_mixin
 
 from . import storage
+from . import storage_migration
 from . import directory
+from . import directory_rollup
 from . import dms_file
+from . import dms_blob
 
 from . import onboarding_onboarding
 from . import onboarding_onboarding_step
@@ -17,7 +20,10 @@ from . import dms_category
 from . import tag
 
 from . import res_company
+from . import res_groups
+from . import res_users
 from . import res_config_settings
 from . import ir_attachment
+from . import attachment_queue
 from . import ir_binary
 from . import mail_thread
@@ -5,6 +5,7 @@
 
 from odoo import _, api, fields, models
 from odoo.exceptions import ValidationError
+from odoo.tools import SQL
 
 
 class DmsAccessGroups(models.Model):
@@ -59,7 +60,7 @@ class DmsAccessGroups(models.Model):
         auto_join=True,
         readonly=True,
     )
-    count_users = fields.Integer(compute="_compute_users", store=True)
+    count_users = fields.Integer(readonly=True)
     count_directories = fields.Integer(compute="_compute_count_directories")
     parent_group_id = fields.Many2one(
         comodel_name="dms.access.group",
@@ -87,16 +88,16 @@ class DmsAccessGroups(models.Model):
         column2="uid",
         string="Explicit Users",
     )
+    # Users of the group, its res.groups and its parent groups, maintained by
+    # _update_users()
     users = fields.Many2many(
         comodel_name="res.users",
         relation="dms_access_group_users_rel",
         column1="gid",
         column2="uid",
         string="Group Users",
-        compute="_compute_users",
         auto_join=True,
-        store=True,
-        recursive=True,
+        readonly=True,
     )
 
     @api.depends("directory_ids")
@@ -139,21 +140,147 @@ class DmsAccessGroups(models.Model):
             res["explicit_user_ids"] = [(6, 0, [self.env.uid])]
         return res
 
-    @api.depends(
-        "parent_group_id",
-        "parent_group_id.users",
-        "group_ids",
-        "group_ids.users",
-        "explicit_user_ids",
-    )
-    def _compute_users(self):
-        for record in self:
-            users = (
-                record.group_ids.users
-                | record.explicit_user_ids
-                | record.parent_group_id.users
+    def _update_users(self, users=None):
+        """
+        Update the users of the groups and of their descendants, with a few
+        set-based queries: only the memberships that changed are written.
+
+        :param users: Restrict the update to these users. Without groups, the
+        memberships of these users are updated in every group.
+        :type users: odoo.model.res_users
+        """
+        if not self and users is None:
+            return
+        self.flush_model(["explicit_user_ids", "group_ids", "parent_path"])
+        self.env["res.groups"].flush_model(["users"])
+        conditions = [SQL("TRUE")]
+        if self:
+            conditions.append(
+                SQL(
+                    "target.parent_path LIKE ANY(%s)",
+                    [f"{group.parent_path}%" for group in self],
+                )
+            )
+        if users is not None:
+            conditions.append(SQL("member.uid = ANY(%s)", users.ids))
+        members = SQL(
+            """
+            SELECT DISTINCT target.id AS gid, member.uid
+            FROM dms_access_group AS target
+                CROSS JOIN LATERAL unnest(
+                    string_to_array(rtrim(target.parent_path, '/'), '/')::integer[]
+                ) AS ancestor(id)
+                JOIN (
+                    SELECT gid, uid FROM dms_access_group_explicit_users_rel
+                    UNION
+                    SELECT rel.gid, groups_users.uid
+                    FROM dms_access_group_groups_rel AS rel
+                        JOIN res_groups_users_rel AS groups_users
+                            ON groups_users.gid = rel.rid
+                ) AS member ON member.gid = ancestor.id
+            WHERE %s
+            """,
+            SQL(" AND ").join(conditions),
+        )
+        # Scope of the update, matching the conditions on the members
+        scope = [SQL("TRUE")]
+        if self:
+            scope.append(
+                SQL(
+                    """rel.gid IN (
+                        SELECT id FROM dms_access_group WHERE parent_path LIKE ANY(%s)
+                    )""",
+                    [f"{group.parent_path}%" for group in self],
+                )
+            )
+        if users is not None:
+            scope.append(SQL("rel.uid = ANY(%s)", users.ids))
+        rows = self.env.execute_query(
+            SQL(
+                """
+                WITH members AS (%s),
+                deleted AS (
+                    DELETE FROM dms_access_group_users_rel AS rel
+                    WHERE %s AND NOT EXISTS (
+                        SELECT 1 FROM members
+                        WHERE members.gid = rel.gid AND members.uid = rel.uid
+                    )
+                    RETURNING rel.gid
+                ),
+                inserted AS (
+                    INSERT INTO dms_access_group_users_rel (gid, uid)
+                    SELECT gid, uid FROM members
+                    ON CONFLICT DO NOTHING
+                    RETURNING gid
+                )
+                SELECT gid FROM deleted UNION SELECT gid FROM inserted
+                """,
+                members,
+                SQL(" AND ").join(scope),
+            )
+        )
+        changed = self.browse(row[0] for row in rows)
+        if not changed:
+            return
+        self.env.cr.execute(
+            SQL(
+                """
+                UPDATE dms_access_group AS access_group
+                SET count_users = (
+                    SELECT COUNT(*) FROM dms_access_group_users_rel AS rel
+                    WHERE rel.gid = access_group.id
+                )
+                WHERE access_group.id = ANY(%s)
+                """,
+                changed.ids,
             )
-            record.update({"users": users, "count_users": len(users)})
+        )
+        changed.invalidate_recordset(["users", "count_users"])
+        # Directories accessible through the groups are cached by user
+        self.env.registry.clear_cache()
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        records = super().create(vals_list)
+        # Directories accessible through the groups are cached by user. Besides
+        # their members, cleared by the update, only new links to directories
+        # change them.
+        if any(vals.get("directory_ids") for vals in vals_list):
+            self.env.registry.clear_cache()
+        records._update_users()
+        return records
+
+    def write(self, vals):
+        res = super().write(vals)
+        # The permissions of the children depend on their parent
+        if any(
+            key in vals
+            for key in [
+                "perm_create",
+                "perm_write",
+                "perm_unlink",
+                "parent_group_id",
+                "directory_ids",
+            ]
+        ):
+            self.env.registry.clear_cache()
+        # The cache is cleared by the update when the members change
+        if any(
+            key in vals for key in ["explicit_user_ids", "group_ids", "parent_group_id"]
+        ):
+            self._update_users()
+        return res
+
+    def unlink(self):
+        # Child groups are deleted along with their parent
+        groups = self.search([("id", "child_of", self.ids)])
+        users = groups.users
+        grants_access = bool(groups.sudo().complete_directory_ids)
+        res = super().unlink()
+        if grants_access:
+            self.env.registry.clear_cache()
+        self.env["dms.access.group"]._update_users(users=users)
+        return res
 
     def copy_data(self, default=None):
         vals_list = super().copy_data(default)
@@ -0,0 +1,195 @@
+# Copyright 2024 Subteno - Timothée Vannier (https://www.subteno.com).
+# License LGPL-3.0 or later (http://www.gnu.org/licenses/lgpl).
+
+import logging
+
+from odoo import api, fields, models
+from odoo.modules import module
+from odoo.tools import SQL
+
+_logger = logging.getLogger(__name__)
+
+# Number of failed attempts after which an attachment is no longer processed
+MAX_ATTEMPTS = 5
+
+
+class DmsAttachmentQueue(models.Model):
+    """Attachments waiting to be mirrored in the documents.
+
+    When the ``dms.attachment_sync_mode`` parameter is ``deferred``, created
+    attachments are enqueued here instead of being mirrored in the documents
+    within the transaction creating them. The queue is processed by batches by a
+    scheduled action. Processing an attachment twice has no effect, and failed
+    attachments are retried up to ``MAX_ATTEMPTS`` times.
+    """
+
+    _name = "dms.attachment.queue"
+    _description = "Attachments Waiting for the Documents"
+    _order = "id"
+    _log_access = False
+
+    attachment_id = fields.Many2one(
+        comodel_name="ir.attachment",
+        required=True,
+        readonly=True,
+        ondelete="cascade",
+    )
+    attaching_to_record = fields.Boolean(readonly=True)
+    create_date = fields.Datetime(readonly=True, default=fields.Datetime.now)
+    attempts = fields.Integer(readonly=True)
+    error = fields.Text(readonly=True)
+
+    _sql_constraints = [
+        (
+            "attachment_uniq",
+            "unique (attachment_id)",
+            "An attachment can only be enqueued once!",
+        )
+    ]
+
+    @api.model
+    def _is_enabled(self):
+        get_param = self.env["ir.config_parameter"].sudo().get_param
+        return get_param("dms.attachment_sync_mode", "sync") == "deferred"
+
+    @api.model
+    def _enqueue(self, attachments):
+        """
+        Enqueue attachments to be mirrored in the documents. An attachment
+        already waiting is not enqueued twice.
+
+        :param odoo.model.ir_attachment attachments: The attachments.
+        """
+        if not attachments:
+            return
+        # An attachment enqueued without the context restricting the storages
+        # is processed with all of them
+        attaching_to_record = bool(self.env.context.get("attaching_to_record"))
+        self.env.cr.execute(
+            SQL(
+                """
+                INSERT INTO dms_attachment_queue
+                    (attachment_id, attaching_to_record, create_date, attempts)
+                SELECT id, %s, now() AT TIME ZONE 'UTC', 0
+                FROM unnest(%s::integer[]) AS id
+                ON CONFLICT (attachment_id) DO UPDATE
+                SET attaching_to_record = dms_attachment_queue.attaching_to_record
+                    AND EXCLUDED.attaching_to_record,
+                    attempts = 0,
+                    error = NULL
+                """,
+                attaching_to_record,
+                attachments.ids,
+            )
+        )
+        self.invalidate_model()
+        self.env.ref("dms.ir_cron_dms_attachment_queue").sudo()._trigger()
+
+    @api.model
+    def _get_backlog(self):
+        """
+        Get the size of the queue.
+
+        :return: The number of attachments waiting, the number of attachments
+        which failed too many times and the creation date of the oldest
+        attachment waiting.
+        :rtype: tuple[int, int, datetime.datetime|None]
+        """
+        self.flush_model()
+        rows = self.env.execute_query(
+            SQL(
+                """
+                SELECT
+                    COUNT(*) FILTER (WHERE attempts < %(max)s),
+                    COUNT(*) FILTER (WHERE attempts >= %(max)s),
+                    MIN(create_date) FILTER (WHERE attempts < %(max)s)
+                FROM dms_attachment_queue
+                """,
+                max=MAX_ATTEMPTS,
+            )
+        )
+        return rows[0]
+
+    @api.model
+    def _process(self, limit=5000, batch_size=200, commit=False):
+        """
+        Mirror the enqueued attachments in the documents, by batches. A failing
+        batch is processed again attachment by attachment, so that a single
+        failing attachment does not block the others.
+
+        :param int limit: The maximum number of attachments processed.
+        :param int batch_size: The number of attachments processed at once.
+        :param bool commit: Whether each batch is committed, releasing the locks
+        of its entries.
+
+        :return: The number of attachments processed.
+        :rtype: int
+        """
+        count = last_id = 0
+        while count < limit:
+            # The entries failing again are retried by the next run only
+            batch = self._claim_batch(min(batch_size, limit - count), last_id)
+            if not batch:
+                break
+            last_id = max(batch.ids)
+            try:
+                with self.env.cr.savepoint():
+                    batch._sync()
+            except Exception:
+                for entry in batch:
+                    entry._sync_single()
+            count += len(batch)
+            if commit:
+                self.env.cr.commit()
+        if count == limit:
+            # More attachments are probably waiting
+            self.env.ref("dms.ir_cron_dms_attachment_queue").sudo()._trigger()
+        return count
+
+    @api.model
+    def _claim_batch(self, size, after_id=0):
+        """Lock and return the next entries to process. Entries locked by another
+        worker are being processed, and are skipped."""
+        self.flush_model()
+        rows = self.env.execute_query(
+            SQL(
+                """
+                SELECT id FROM dms_attachment_queue
+                WHERE attempts < %s AND id > %s
+                ORDER BY id
+                LIMIT %s
+                FOR UPDATE SKIP LOCKED
+                """,
+                MAX_ATTEMPTS,
+                after_id,
+                size,
+            )
+        )
+        return self.sudo().browse(row[0] for row in rows)
+
+    def _sync(self):
+        """Mirror the attachments of the entries and remove the entries."""
+        grouped = self.grouped("attaching_to_record")
+        for attaching_to_record, entries in grouped.items():
+            attachments = entries.attachment_id.with_context(
+                attaching_to_record=attaching_to_record
+            )
+            attachments._dms_operations()
+        self.unlink()
+
+    def _sync_single(self):
+        try:
+            with self.env.cr.savepoint():
+                self._sync()
+        except Exception as error:
+            _logger.warning(
+                "Failed to mirror the attachment %s in the documents",
+                self.attachment_id.id,
+                exc_info=True,
+            )
+            self.write({"attempts": self.attempts + 1, "error": str(error)})
+
+    @api.model
+    def _cron_process(self):
+        # Batches are only committed outside of tests
+        self._process(commit=not module.current_test)
@@ -12,22 +12,27 @@ class Base(models.AbstractModel):
     def unlink(self):
         """Cascade DMS related resources removal.
         Avoid executing in ir.* models (ir.mode, ir.model.fields, etc), in transient
-        models and in the models we want to check."""
-        result = super().unlink()
-        if (
+        models and in the models we want to check.
+        The models without linked directories and files are skipped without any
+        query, using the cached set of the linked models."""
+        cascade = (
             self.ids
             and not self._name.startswith("ir.")
             and not self.is_transient()
             and self._name not in ("dms.file", "dms.directory")
-        ):
-            domain = [("res_model", "=", self._name), ("res_id", "in", self.ids)]
+            and self._name in self.env["dms.directory"]._get_linked_models()
+        )
+        result = super().unlink()
+        if cascade:
+            # The files of the directories are removed with them
             # Has to check if existing before unlinking, because even if the search
             # returns an empty recordset, it will still call the unlink method on it.
             # This can result in an infinite loop and a recursion depth error.
-            files = self.env["dms.file"].sudo().search(domain)
-            if files:
-                files.unlink()
-            directories = self.env["dms.directory"].sudo().search(domain)
+            directories = (
+                self.env["dms.directory"]
+                .sudo()
+                .search([("res_model", "=", self._name), ("res_id", "in", self.ids)])
+            )
             if directories:
                 directories.unlink()
         return result
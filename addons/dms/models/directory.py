@@ -10,14 +10,18 @@ import logging
 import os
 from ast import literal_eval
 from collections import defaultdict
+from contextlib import contextmanager
 from typing import Literal  # noqa # pylint: disable=unused-import
 
+from psycopg2 import errors
+
 from odoo import _, api, fields, models, tools
 from odoo.exceptions import UserError, ValidationError
 from odoo.osv.expression import AND, OR
-from odoo.tools import consteq, human_size
+from odoo.tools import SQL, consteq, human_size
 
 from ..tools.file import check_name, unique_name
+from .directory_rollup import ANCESTORS
 
 _logger = logging.getLogger(__name__)
 _path = os.path.dirname(os.path.dirname(__file__))
@@ -45,6 +49,7 @@ class DmsDirectory(models.Model):
     _directory_field = _parent_name
 
     parent_path = fields.Char(index="btree")
+    access_token = fields.Char(index="btree_not_null")
     is_root_directory = fields.Boolean(
         default=False,
         help="""Indicates if the directory is a root directory.
@@ -176,18 +181,16 @@ class DmsDirectory(models.Model):
     count_elements = fields.Integer(compute="_compute_count_elements")
 
     count_total_directories = fields.Integer(
-        compute="_compute_count_total_directories", string="Total Subdirectories"
+        compute="_compute_totals", string="Total Subdirectories"
     )
 
-    count_total_files = fields.Integer(
-        compute="_compute_count_total_files", string="Total Files"
-    )
+    count_total_files = fields.Integer(compute="_compute_totals", string="Total Files")
 
     count_total_elements = fields.Integer(
         compute="_compute_count_total_elements", string="Total Elements"
     )
 
-    size = fields.Float(compute="_compute_size")
+    size = fields.Float(compute="_compute_totals")
     human_size = fields.Char(
         compute="_compute_human_size", string="Size (human readable)"
     )
@@ -214,7 +217,7 @@ class DmsDirectory(models.Model):
         """Special rules for directories."""
         self_filter = [
             ("storage_id_inherit_access_from_parent_record", "=", False),
-            ("id", "in", self._get_access_groups_query(operation)),
+            ("id", "in", self._get_access_directories(operation)),
         ]
         # Upstream only filters by parent directory
         result = super()._get_domain_by_access_groups(operation)
@@ -239,28 +242,35 @@ class DmsDirectory(models.Model):
         return res
 
     def check_access_token(self, access_token=False):
-        res = False
-        if access_token:
-            items = (
-                self.env["dms.directory"]
-                .sudo()
-                .search([("access_token", "=", access_token)])
+        if not access_token or not self:
+            return False
+        token_directory = self._get_token_directory(access_token)
+        if not token_directory:
+            return False
+        # The token gives access to its directory and all its subdirectories
+        parent_path = self.sudo().parent_path or ""
+        return parent_path.startswith(token_directory[1])
+
+    @api.model
+    @tools.ormcache("access_token")
+    def _get_token_directory(self, access_token):
+        """
+        Get the directory shared with an access token. The lookup is cached, and
+        cleared when the token or the parent of a directory changes.
+
+        :param str access_token: The access token.
+
+        :return: The id and the parent path of the directory, if any.
+        :rtype: tuple[int, str]|None
+        """
+        self.flush_model(["access_token", "parent_path"])
+        rows = self.env.execute_query(
+            SQL(
+                "SELECT id, parent_path FROM dms_directory WHERE access_token = %s",
+                access_token,
             )
-            if items:
-                item = items[0]
-                if item.id == self.id:
-                    return True
-                # sudo because the user might not usually have access to the record but
-                # now the token is valid.
-                directory_item = self.sudo()
-                while directory_item.parent_id:
-                    if directory_item.id == item.id:
-                        return True
-                    directory_item = directory_item.parent_id
-                # Fix last level
-                if directory_item.id == item.id:
-                    return True
-        return res
+        )
+        return rows[0] if rows else None
 
     @api.model
     def _get_parent_categories(self, access_token):
@@ -285,16 +295,94 @@ class DmsDirectory(models.Model):
             return [self]
         return directories
 
+    @api.model
     def _get_own_root_directories(self):
-        res = self.env["dms.directory"].search_read(
-            [("is_hidden", "=", False)], ["parent_id"]
+        """
+        Get the root directories of the current user: the visible directories
+        whose parent directory is not accessible by the user.
+
+        :return: The ids of the root directories.
+        :rtype: list[int]
+        """
+        inherited_access_domain = [
+            ("storage_id_save_type", "=", "attachment"),
+            ("storage_id_inherit_access_from_parent_record", "=", True),
+        ]
+        if self._get_inherited_access_models(inherited_access_domain):
+            # The access inherited from the linked records changes with their
+            # record rules and followers, which do not clear the cache
+            return list(self._query_own_root_directory_ids())
+        company_ids = tuple(sorted(self.env.companies.ids))
+        return list(self._get_own_root_directory_ids(company_ids))
+
+    @api.model
+    @tools.ormcache("self.env.uid", "self.env.su", "company_ids")
+    def _get_own_root_directory_ids(self, company_ids):
+        """
+        Get the root directories of the current user, cached by user. The cache
+        is cleared when directories are created, moved or deleted, or when their
+        access groups change.
+
+        :param tuple company_ids: The ids of the allowed companies, as they
+        restrict the accessible directories.
+
+        :return: The ids of the root directories.
+        :rtype: tuple[int]
+        """
+        return self._query_own_root_directory_ids()
+
+    @api.model
+    def _query_own_root_directory_ids(self):
+        """Get the root directories of the current user in a single query."""
+        visible = self._search([("is_hidden", "=", False)]).subselect()
+        rows = self.env.execute_query(
+            SQL(
+                """
+                SELECT directory.id
+                FROM dms_directory AS directory
+                WHERE directory.id IN %(visible)s
+                    AND (
+                        directory.parent_id IS NULL
+                        OR directory.parent_id NOT IN %(visible)s
+                    )
+                ORDER BY directory.id
+                """,
+                visible=visible,
+            )
         )
-        all_ids = [value["id"] for value in res]
-        res_ids = []
-        for item in res:
-            if not item["parent_id"] or item["parent_id"][0] not in all_ids:
-                res_ids.append(item["id"])
-        return res_ids
+        return tuple(row[0] for row in rows)
+
+    @api.model
+    @tools.ormcache()
+    def _get_linked_models(self):
+        """
+        Get the models whose records can be linked to directories and files. The
+        result is cached, and cleared when directories are created or linked to
+        another model, or when the linked models of a storage change.
+
+        :return: The names of the models.
+        :rtype: frozenset[str]
+        """
+        model_ids = self.env["dms.storage"]._fields["model_ids"]
+        self.env["dms.storage"].flush_model(["model_ids"])
+        self.env["dms.file"].flush_model(["res_model"])
+        self.flush_model(["res_model"])
+        rows = self.env.execute_query(
+            SQL(
+                """
+                SELECT res_model FROM dms_directory WHERE res_model IS NOT NULL
+                UNION
+                SELECT res_model FROM dms_file WHERE res_model IS NOT NULL
+                UNION
+                SELECT model.model
+                FROM %s AS rel
+                    JOIN ir_model AS model ON model.id = rel.%s
+                """,
+                SQL.identifier(model_ids.relation),
+                SQL.identifier(model_ids.column2),
+            )
+        )
+        return frozenset(row[0] for row in rows)
 
     allowed_model_ids = fields.Many2many(
         related="storage_id.model_ids",
@@ -321,6 +409,20 @@ class DmsDirectory(models.Model):
         store=True,
     )
 
+    _sql_constraints = [
+        (
+            "parent_name_uniq",
+            "unique (parent_id, name)",
+            "A directory with the same name already exists.",
+        ),
+        (
+            "root_name_uniq",
+            "EXCLUDE USING btree (storage_id WITH =, name WITH =) "
+            "WHERE (is_root_directory)",
+            "A directory with the same name already exists.",
+        ),
+    ]
+
     @api.depends("res_model")
     def _compute_model_id(self):
         for record in self:
@@ -426,41 +528,76 @@ class DmsDirectory(models.Model):
         for record in self:
             record.count_elements = record.count_files + record.count_directories
 
-    def _compute_count_total_directories(self):
-        for record in self:
-            count = (
-                self.search_count([("id", "child_of", record.id)]) if record.id else 0
-            )
-            record.count_total_directories = count - 1 if count > 0 else 0
-
-    def _compute_count_total_files(self):
-        model = self.env["dms.file"]
-        for record in self:
-            # Prevent error in some NewId cases
-            record.count_total_files = (
-                model.search_count([("directory_id", "child_of", record.id)])
-                if record.id
-                else 0
-            )
-
     def _compute_count_total_elements(self):
         for record in self:
             record.count_total_elements = (
                 record.count_total_files + record.count_total_directories
             )
 
-    def _compute_size(self):
-        sudo_model = self.env["dms.file"].sudo()
+    def _compute_totals(self):
+        rollup = self.env["dms.directory.rollup"]
+        if rollup._is_enabled():
+            totals = rollup._read_totals(self._origin.ids)
+        else:
+            totals = self._origin._get_totals()
         for record in self:
-            # Avoid NewId
-            if not record.id:
-                record.size = 0
-                continue
-            recs = sudo_model.search_read(
-                domain=[("directory_id", "child_of", record.id)],
-                fields=["size"],
+            size, count_files, count_directories = totals.get(
+                record._origin.id, (0, 0, 0)
             )
-            record.size = sum(rec.get("size", 0) for rec in recs)
+            record.size = size
+            record.count_total_files = count_files
+            record.count_total_directories = count_directories
+
+    def _get_totals(self):
+        """
+        Get the size, the number of files and the number of subdirectories of
+        the subtrees of the directories, with a single query for the whole
+        recordset. The size takes every file into account, while the files and
+        subdirectories are counted only if they are accessible by the user.
+
+        :return: The size, files and subdirectories count by directory id.
+        :rtype: dict
+        """
+        if not self.ids:
+            return {}
+        file_model = self.env["dms.file"]
+        file_model.flush_model(["directory_id", "size", "active"])
+        self.flush_model(["parent_path"])
+        # The access rules are only evaluated on the subtrees of the directories
+        subtree = self.sudo()._search(
+            OR(
+                [
+                    [("parent_path", "=like", f"{path}%")]
+                    for path in set(self.sudo().mapped("parent_path"))
+                ]
+            )
+        )
+        rows = self.env.execute_query(
+            SQL(
+                """
+                SELECT
+                    ancestor.id,
+                    COALESCE(SUM(file.size), 0),
+                    COUNT(file.id) FILTER (WHERE file.id IN %(files)s),
+                    COUNT(DISTINCT directory.id) FILTER (
+                        WHERE directory.id != ancestor.id
+                            AND directory.id IN %(directories)s
+                    )
+                FROM dms_directory AS directory
+                    CROSS JOIN LATERAL %(ancestors)s AS ancestor(id)
+                    LEFT JOIN dms_file AS file
+                        ON file.directory_id = directory.id AND file.active
+                WHERE directory.id IN %(subtree)s AND ancestor.id = ANY(%(ids)s)
+                GROUP BY ancestor.id
+                """,
+                files=file_model._search([("directory_id", "in", subtree)]).subselect(),
+                directories=self._search([("id", "in", subtree)]).subselect(),
+                ancestors=SQL(ANCESTORS, SQL.identifier("directory", "parent_path")),
+                subtree=subtree.subselect(),
+                ids=self.ids,
+            )
+        )
+        return {row[0]: row[1:] for row in rows}
 
     @api.depends("size")
     def _compute_human_size(self):
@@ -470,6 +607,7 @@ class DmsDirectory(models.Model):
     @api.depends(
         "group_ids",
         "inherit_group_ids",
+        "parent_id",
         "parent_id.complete_group_ids",
         "parent_path",
     )
@@ -479,7 +617,61 @@ class DmsDirectory(models.Model):
             groups = one.group_ids
             if one.inherit_group_ids:
                 groups |= one.parent_id.complete_group_ids
-            self.complete_group_ids = groups
+            one.complete_group_ids = groups
+
+    def _update_complete_groups(self):
+        """
+        Update the complete groups of the directories and of their subtrees, with
+        a few set-based queries instead of recomputing every directory.
+
+        The complete groups of a directory are the groups of the directory and of
+        its ancestors, up to the nearest one not inheriting groups from its parent.
+        """
+        if not self:
+            return
+        self.flush_model(["group_ids", "inherit_group_ids", "parent_path"])
+        self.env.cr.execute(
+            SQL(
+                """
+                WITH targets AS (
+                    SELECT id, parent_path FROM dms_directory
+                    WHERE parent_path LIKE ANY(%s)
+                ), chain AS (
+                    SELECT target.id AS aid, ancestor.id, ancestor.depth
+                    FROM targets AS target
+                        CROSS JOIN LATERAL unnest(
+                            string_to_array(rtrim(target.parent_path, '/'), '/')
+                                ::integer[]
+                        ) WITH ORDINALITY AS ancestor(id, depth)
+                ), cut AS (
+                    SELECT chain.aid, MAX(chain.depth) AS depth
+                    FROM chain
+                        JOIN dms_directory AS directory ON directory.id = chain.id
+                    WHERE directory.inherit_group_ids IS NOT TRUE
+                    GROUP BY chain.aid
+                ), computed AS (
+                    SELECT DISTINCT chain.aid, rel.gid
+                    FROM chain
+                        LEFT JOIN cut ON cut.aid = chain.aid
+                        JOIN dms_directory_groups_rel AS rel ON rel.aid = chain.id
+                    WHERE chain.depth >= COALESCE(cut.depth, 0)
+                ), deleted AS (
+                    DELETE FROM dms_directory_complete_groups_rel AS rel
+                    WHERE rel.aid IN (SELECT id FROM targets)
+                        AND NOT EXISTS (
+                            SELECT 1 FROM computed
+                            WHERE computed.aid = rel.aid AND computed.gid = rel.gid
+                        )
+                )
+                INSERT INTO dms_directory_complete_groups_rel (aid, gid)
+                SELECT aid, gid FROM computed
+                ON CONFLICT DO NOTHING
+                """,
+                [f"{directory.parent_path}%" for directory in self],
+            )
+        )
+        self.invalidate_model(["complete_group_ids"])
+        self.env["dms.access.group"].invalidate_model(["complete_directory_ids"])
 
     # View
     @api.depends("is_root_directory")
@@ -563,21 +755,29 @@ class DmsDirectory(models.Model):
 
     @api.constrains("name")
     def _check_name(self):
+        if not self.env.context.get("check_name", True):
+            return
         for record in self:
-            if self.env.context.get("check_name", True) and not check_name(record.name):
+            if not check_name(record.name):
                 raise ValidationError(_("The directory name is invalid."))
-            if record.is_root_directory:
-                children = record.sudo().storage_id.root_directory_ids
-            else:
-                children = record.sudo().parent_id.child_directory_ids
 
-            if children.filtered(
-                lambda child, record=record: child.name == record.name
-                and child != record
+    @contextmanager
+    def _check_name_unique(self):
+        """Raise a validation error when the names of the subdirectories of a
+        directory, or of the root directories of a storage, are not unique,
+        which is enforced by the database."""
+        try:
+            with self.env.cr.savepoint():
+                yield
+        except (errors.UniqueViolation, errors.ExclusionViolation) as error:
+            if error.diag.constraint_name not in (
+                f"{self._table}_parent_name_uniq",
+                f"{self._table}_root_name_uniq",
             ):
-                raise ValidationError(
-                    _("A directory with the same name already exists.")
-                )
+                raise
+            raise ValidationError(
+                _("A directory with the same name already exists.")
+            ) from None
 
     # Create, Update, Delete
     def _inverse_starred(self):
@@ -664,7 +864,9 @@ class DmsDirectory(models.Model):
         ctx = dict(self.env.context).copy()
         ctx.update({"default_parent_id": False})
         self.env.registry.clear_cache()
-        res = super(DmsDirectory, self.with_context(**ctx)).create(vals_list)
+        with self._check_name_unique():
+            res = super(DmsDirectory, self.with_context(**ctx)).create(vals_list)
+            self.env["dms.directory.rollup"]._add_directories(res)
         return res
 
     def write(self, vals):
@@ -685,15 +887,29 @@ class DmsDirectory(models.Model):
                         )
                 elif old_storage_id != new_storage_id:
                     raise UserError(_("It is not possible to change the storage."))
-        # Groups part
-        if any(key in vals for key in ["group_ids", "inherit_group_ids"]):
-            res = super().write(vals)
-            domain = [("id", "child_of", self.ids)]
-            records = self.sudo().search(domain)
-            records.modified(["group_ids"])
-            records.flush_recordset()
-        else:
-            res = super().write(vals)
+        # Groups part: the complete groups of the subtrees are updated at once
+        # instead of being recomputed directory by directory
+        update_groups = any(
+            key in vals for key in ["group_ids", "inherit_group_ids", "parent_id"]
+        )
+        if any(key in vals for key in ["access_token", "res_model", "res_id"]):
+            # Directories shared with a token and root directories are cached
+            self.env.registry.clear_cache()
+        protected = self.browse()
+        if update_groups:
+            protected = self.sudo().search([("id", "child_of", self.ids)])
+        rollup = self.env["dms.directory.rollup"]
+        names_keys = ["name", "parent_id", "storage_id", "is_root_directory"]
+        with self.env.protecting([self._fields["complete_group_ids"]], protected):
+            if any(key in vals for key in names_keys):
+                with self._check_name_unique(), rollup._track_directories(self, vals):
+                    res = super().write(vals)
+            else:
+                res = super().write(vals)
+        if update_groups:
+            self.sudo()._update_complete_groups()
+            # Accessible directories are cached by user
+            self.env.registry.clear_cache()
         return res
 
     @api.depends_context("directory_short_name")
@@ -713,7 +929,10 @@ class DmsDirectory(models.Model):
         self.file_ids.unlink()
         if self.child_directory_ids:
             self.child_directory_ids.unlink()
-        return super(DmsDirectory, self.exists()).unlink()
+        directories = self.exists()
+        self.env["dms.directory.rollup"]._remove_directories(directories)
+        self.env.registry.clear_cache()
+        return super(DmsDirectory, directories).unlink()
 
     @api.model
     def _search_panel_domain_image(
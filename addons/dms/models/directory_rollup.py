@@ -0,0 +1,299 @@
+# Copyright 2024 Subteno - Timothée Vannier (https://www.subteno.com).
+# License LGPL-3.0 or later (http://www.gnu.org/licenses/lgpl).
+
+import logging
+from collections import defaultdict
+from contextlib import contextmanager
+
+from odoo import api, fields, models
+from odoo.tools import SQL, str2bool
+
+_logger = logging.getLogger(__name__)
+
+# Ancestors of a directory, itself included, from its parent path
+ANCESTORS = "unnest(string_to_array(rtrim(%s, '/'), '/')::integer[])"
+
+
+class DmsDirectoryRollup(models.Model):
+    """Totals of the subtree of every directory.
+
+    When enabled with the ``dms.use_directory_rollup`` parameter, the size and
+    the total numbers of files and subdirectories of a directory are read from
+    this table instead of being aggregated over its subtree. The totals are
+    maintained by deltas applied to the ancestors of the created, moved and
+    deleted files and directories. Unlike the aggregated totals, they count
+    every active file and subdirectory, whether the user can access it or not.
+    """
+
+    _name = "dms.directory.rollup"
+    _description = "Directory Subtree Totals"
+    _log_access = False
+
+    directory_id = fields.Many2one(
+        comodel_name="dms.directory",
+        required=True,
+        readonly=True,
+        ondelete="cascade",
+    )
+    size = fields.Float(readonly=True)
+    count_files = fields.Integer(readonly=True)
+    count_directories = fields.Integer(readonly=True)
+
+    _sql_constraints = [
+        (
+            "directory_uniq",
+            "unique (directory_id)",
+            "The totals of a directory must be unique!",
+        )
+    ]
+
+    @api.model
+    def _is_enabled(self):
+        get_param = self.env["ir.config_parameter"].sudo().get_param
+        return str2bool(get_param("dms.use_directory_rollup", "False"))
+
+    @api.model
+    def _read_totals(self, directory_ids):
+        """
+        Read the totals of the given directories.
+
+        :param list directory_ids: The ids of the directories.
+
+        :return: The size, files and subdirectories count by directory id.
+        :rtype: dict
+        """
+        rows = self.env.execute_query(
+            SQL(
+                """
+                SELECT directory_id, size, count_files, count_directories
+                FROM dms_directory_rollup
+                WHERE directory_id = ANY(%s)
+                """,
+                list(directory_ids),
+            )
+        )
+        return {row[0]: row[1:] for row in rows}
+
+    @api.model
+    def _apply_deltas(self, deltas):
+        """
+        Add deltas to the totals of directories and of all their ancestors.
+
+        :param dict deltas: The size, files and subdirectories deltas by
+        directory id.
+        """
+        deltas = {key: delta for key, delta in deltas.items() if key and any(delta)}
+        if not deltas:
+            return
+        self.env["dms.directory"].flush_model(["parent_path"])
+        ids, sizes, files, directories = zip(
+            *((key, *delta) for key, delta in deltas.items()), strict=True
+        )
+        self.env.cr.execute(
+            SQL(
+                """
+                UPDATE dms_directory_rollup AS rollup
+                SET size = rollup.size + delta.size,
+                    count_files = rollup.count_files + delta.count_files,
+                    count_directories =
+                        rollup.count_directories + delta.count_directories
+                FROM (
+                    SELECT
+                        ancestor.id,
+                        SUM(change.size) AS size,
+                        SUM(change.count_files) AS count_files,
+                        SUM(change.count_directories) AS count_directories
+                    FROM unnest(
+                        %s::integer[], %s::float8[], %s::integer[], %s::integer[]
+                    ) AS change(id, size, count_files, count_directories)
+                        JOIN dms_directory AS directory ON directory.id = change.id
+                        CROSS JOIN LATERAL %s AS ancestor(id)
+                    GROUP BY ancestor.id
+                ) AS delta
+                WHERE rollup.directory_id = delta.id
+                """,
+                list(ids),
+                list(sizes),
+                list(files),
+                list(directories),
+                SQL(ANCESTORS, SQL.identifier("directory", "parent_path")),
+            )
+        )
+        self.invalidate_model()
+
+    @api.model
+    def _get_file_deltas(self, files, sign):
+        deltas = defaultdict(lambda: [0.0, 0, 0])
+        for dms_file in files.sudo().with_context(active_test=False):
+            if dms_file.active and dms_file.directory_id:
+                delta = deltas[dms_file.directory_id.id]
+                delta[0] += sign * dms_file.size
+                delta[1] += sign
+        return deltas
+
+    @api.model
+    def _get_directory_deltas(self, directories, sign):
+        """Get the deltas moving the subtrees of the directories from or to
+        their parent directory."""
+        totals = self._read_totals(directories.ids)
+        deltas = defaultdict(lambda: [0.0, 0, 0])
+        for directory in directories.sudo():
+            if directory.parent_id:
+                size, count_files, count_directories = totals.get(
+                    directory.id, (0, 0, 0)
+                )
+                delta = deltas[directory.parent_id.id]
+                delta[0] += sign * size
+                delta[1] += sign * count_files
+                delta[2] += sign * (count_directories + 1)
+        return deltas
+
+    @api.model
+    def _add_files(self, files):
+        if self._is_enabled():
+            self._apply_deltas(self._get_file_deltas(files, 1))
+
+    @api.model
+    def _remove_files(self, files):
+        if self._is_enabled():
+            self._apply_deltas(self._get_file_deltas(files, -1))
+
+    @api.model
+    def _add_directories(self, directories):
+        if not self._is_enabled():
+            return
+        self.env.cr.execute(
+            SQL(
+                """
+                INSERT INTO dms_directory_rollup
+                    (directory_id, size, count_files, count_directories)
+                SELECT id, 0, 0, 0 FROM unnest(%s::integer[]) AS id
+                ON CONFLICT (directory_id) DO NOTHING
+                """,
+                directories.ids,
+            )
+        )
+        self._apply_deltas(self._get_directory_deltas(directories, 1))
+
+    @api.model
+    def _remove_directories(self, directories):
+        if self._is_enabled():
+            self._apply_deltas(self._get_directory_deltas(directories, -1))
+
+    @contextmanager
+    def _track_files(self, files, vals):
+        """Move the totals of files whose directory, size or state is written."""
+        keys = {"directory_id", "size", "active"}
+        if (
+            not self._is_enabled()
+            or not keys.intersection(vals)
+            or self.env.context.get("dms_rollup_untracked")
+        ):
+            yield
+            return
+        self._remove_files(files)
+        yield
+        self._add_files(files)
+
+    @contextmanager
+    def _track_directories(self, directories, vals):
+        """Move the totals of directories whose parent directory is written."""
+        if not self._is_enabled() or "parent_id" not in vals:
+            yield
+            return
+        self._remove_directories(directories)
+        yield
+        self._apply_deltas(self._get_directory_deltas(directories, 1))
+
+    @api.model
+    def _get_totals_query(self):
+        """Query computing the totals of every directory from its subtree."""
+        return SQL(
+            """
+            WITH files AS (
+                SELECT
+                    ancestor.id,
+                    SUM(file.size) AS size,
+                    COUNT(*) AS count_files
+                FROM dms_file AS file
+                    JOIN dms_directory AS directory
+                        ON directory.id = file.directory_id
+                    CROSS JOIN LATERAL %(ancestors)s AS ancestor(id)
+                WHERE file.active
+                GROUP BY ancestor.id
+            ), directories AS (
+                SELECT ancestor.id, COUNT(*) - 1 AS count_directories
+                FROM dms_directory AS directory
+                    CROSS JOIN LATERAL %(ancestors)s AS ancestor(id)
+                GROUP BY ancestor.id
+            )
+            SELECT
+                directory.id,
+                COALESCE(files.size, 0),
+                COALESCE(files.count_files, 0),
+                COALESCE(directories.count_directories, 0)
+            FROM dms_directory AS directory
+                LEFT JOIN files ON files.id = directory.id
+                LEFT JOIN directories ON directories.id = directory.id
+            """,
+            ancestors=SQL(ANCESTORS, SQL.identifier("directory", "parent_path")),
+        )
+
+    @api.model
+    def _rebuild(self):
+        """Compute again the totals of every directory from their subtree."""
+        self.env["dms.file"].flush_model(["directory_id", "size", "active"])
+        self.env["dms.directory"].flush_model(["parent_path"])
+        self.env.cr.execute(SQL("DELETE FROM dms_directory_rollup"))
+        self.env.cr.execute(
+            SQL(
+                """
+                INSERT INTO dms_directory_rollup
+                    (directory_id, size, count_files, count_directories)
+                %s
+                """,
+                self._get_totals_query(),
+            )
+        )
+        self.invalidate_model()
+        _logger.info("Rebuilt the totals of %s DMS directories", self.env.cr.rowcount)
+
+    @api.model
+    def _check_consistency(self):
+        """
+        Compare the maintained totals with the totals computed from the subtrees.
+
+        :return: The directories whose totals are missing or out of date.
+        :rtype: odoo.model.dms_directory
+        """
+        self.env["dms.file"].flush_model(["directory_id", "size", "active"])
+        self.env["dms.directory"].flush_model(["parent_path"])
+        rows = self.env.execute_query(
+            SQL(
+                """
+                SELECT computed.id
+                FROM (%s) AS computed(id, size, count_files, count_directories)
+                    LEFT JOIN dms_directory_rollup AS rollup
+                        ON rollup.directory_id = computed.id
+                WHERE rollup.id IS NULL
+                    OR rollup.size != computed.size
+                    OR rollup.count_files != computed.count_files
+                    OR rollup.count_directories != computed.count_directories
+                """,
+                self._get_totals_query(),
+            )
+        )
+        directories = self.env["dms.directory"].browse(row[0] for row in rows)
+        if directories:
+            _logger.warning(
+                "The totals of %s DMS directories are out of date: %s",
+                len(directories),
+                directories.ids,
+            )
+        return directories
+
+    @api.model
+    def _cron_check_consistency(self):
+        """Rebuild the totals when some of them are found out of date."""
+        if self._is_enabled() and self._check_consistency():
+            self._rebuild()
@@ -0,0 +1,143 @@
+# Copyright 2024 Subteno - Timothée Vannier (https://www.subteno.com).
+# License LGPL-3.0 or later (http://www.gnu.org/licenses/lgpl).
+
+import logging
+
+from psycopg2 import errors
+
+from odoo import api, fields, models
+from odoo.tools import SQL
+
+_logger = logging.getLogger(__name__)
+
+
+class DmsBlob(models.Model):
+    """Content shared by every file with the same checksum and save type.
+
+    Used by storages with content deduplication enabled: instead of storing its
+    own copy of the content, a file references the blob matching its checksum.
+    A blob is deleted as soon as the last file referencing it is gone.
+    """
+
+    _name = "dms.blob"
+    _description = "Deduplicated File Content"
+    _rec_name = "checksum"
+
+    checksum = fields.Char(
+        string="Checksum/SHA1", required=True, readonly=True, index="btree"
+    )
+    save_type = fields.Selection(
+        selection=[("database", "Database"), ("file", "Filestore")],
+        required=True,
+        readonly=True,
+    )
+    size = fields.Float(readonly=True)
+    content_binary = fields.Binary(attachment=False, prefetch=False, readonly=True)
+    content_file = fields.Binary(attachment=True, prefetch=False, readonly=True)
+    file_ids = fields.One2many(
+        comodel_name="dms.file",
+        inverse_name="blob_id",
+        string="Files",
+        context={"active_test": False},
+        readonly=True,
+    )
+    ref_count = fields.Integer(
+        compute="_compute_ref_count", string="References", compute_sudo=True
+    )
+
+    _sql_constraints = [
+        (
+            "checksum_save_type_uniq",
+            "unique (checksum, save_type)",
+            "The content of a blob must be unique per save type!",
+        )
+    ]
+
+    def _compute_ref_count(self):
+        data = (
+            self.env["dms.file"]
+            .with_context(active_test=False)
+            ._read_group([("blob_id", "in", self.ids)], ["blob_id"], ["__count"])
+        )
+        counts = {blob.id: count for blob, count in data}
+        for record in self:
+            record.ref_count = counts.get(record.id, 0)
+
+    @api.model
+    def _get_or_create(self, checksum, save_type, binary):
+        """
+        Get the blob holding the given content, creating it if needed.
+
+        :param str checksum: The SHA1 checksum of the content.
+        :param str save_type: The save type of the storage (database or file).
+        :param bytes binary: The raw content.
+
+        :return: The blob holding the content.
+        :rtype: odoo.model.dms_blob
+        """
+        domain = [("checksum", "=", checksum), ("save_type", "=", save_type)]
+        blob = self.sudo().search(domain, limit=1)
+        if blob:
+            return blob
+        # The blob is inserted unless the same content was stored concurrently
+        rows = self.env.execute_query(
+            SQL(
+                """
+                INSERT INTO dms_blob (
+                    checksum, save_type, size, content_binary,
+                    create_uid, create_date, write_uid, write_date
+                )
+                VALUES (
+                    %(checksum)s, %(save_type)s, %(size)s, %(content)s,
+                    %(uid)s, now() at time zone 'UTC', %(uid)s, now() at time zone 'UTC'
+                )
+                ON CONFLICT (checksum, save_type) DO NOTHING
+                RETURNING id
+                """,
+                checksum=checksum,
+                save_type=save_type,
+                size=binary and len(binary) or 0,
+                content=binary if save_type == "database" else None,
+                uid=self.env.uid,
+            )
+        )
+        if not rows:
+            blob = self.sudo().search(domain, limit=1)
+            if not blob:
+                # The blob stored by another transaction is not visible yet: the
+                # transaction is retried
+                raise errors.SerializationFailure(
+                    f"The content {checksum} was stored by a concurrent transaction"
+                )
+            return blob
+        blob = self.sudo().browse(rows[0][0])
+        if save_type == "file":
+            self.env["ir.attachment"]._dms_set_raw(blob, "content_file", binary)
+        return blob
+
+    def _gc_unreferenced(self):
+        """Delete the blobs of the recordset that are no longer referenced."""
+        if not self:
+            return
+        self.env["dms.file"].flush_model(["blob_id"])
+        self.env.cr.execute(
+            SQL(
+                """
+                SELECT blob.id
+                FROM dms_blob AS blob
+                WHERE blob.id = ANY(%s)
+                    AND NOT EXISTS (
+                        SELECT 1 FROM dms_file AS file WHERE file.blob_id = blob.id
+                    )
+                """,
+                self.ids,
+            )
+        )
+        unreferenced = self.sudo().browse(row[0] for row in self.env.cr.fetchall())
+        if unreferenced:
+            _logger.debug("Deleting %s unreferenced DMS blobs", len(unreferenced))
+            unreferenced.unlink()
+
+    @api.autovacuum
+    def _gc_unreferenced_blobs(self):
+        self.search([])._gc_unreferenced()
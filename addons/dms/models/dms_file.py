@@ -5,20 +5,28 @@
 # License LGPL-3.0 or later (http://www.gnu.org/licenses/lgpl).
 
 import base64
+import binascii
 import hashlib
+import io
 import json
 import logging
-from collections import defaultdict
+import os
+import tempfile
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 
-from PIL import Image
+import psycopg2
+from psycopg2 import errors
 
 from odoo import _, api, fields, models, tools
 from odoo.exceptions import UserError, ValidationError
+from odoo.modules import module
 from odoo.osv import expression
-from odoo.tools import consteq, human_size
+from odoo.tools import SQL, consteq, human_size
 from odoo.tools.mimetypes import guess_mimetype
 
-from ..tools import file
+from ..tools import file, preview, stream, thumbnail
 
 _logger = logging.getLogger(__name__)
 
@@ -56,6 +64,7 @@ class DMSFile(models.Model):
         tracking=True,  # Leave log if "moved" to another directory
     )
     root_directory_id = fields.Many2one(related="directory_id.root_directory_id")
+    access_token = fields.Char(index="btree_not_null")
     # Override acording to defined in AbstractDmsMixin
     storage_id = fields.Many2one(
         related="directory_id.storage_id",
@@ -131,24 +140,45 @@ class DMSFile(models.Model):
         compute="_compute_migration", store=True, compute_sudo=True
     )
     content_file = fields.Binary(attachment=True, prefetch=False)
+    blob_id = fields.Many2one(
+        comodel_name="dms.blob",
+        string="Shared Content",
+        ondelete="restrict",
+        index="btree_not_null",
+        prefetch=False,
+        readonly=True,
+    )
 
-    # Extend inherited field(s)
-    image_1920 = fields.Image(compute="_compute_image_1920", store=True, readonly=False)
-
-    @api.depends("mimetype", "content")
-    def _compute_image_1920(self):
-        """Provide thumbnail automatically if possible."""
-        for one in self.filtered("mimetype"):
-            # Image.MIME provides a dict of mimetypes supported by Pillow,
-            # SVG is not present in the dict but is also a supported image format
-            # lacking a better solution, it's being added manually
-            # Some component modifies the PIL dictionary by adding PDF as a valid
-            # image type, so it must be explicitly excluded.
-            if one.mimetype != "application/pdf" and one.mimetype in (
-                *Image.MIME.values(),
-                "image/svg+xml",
-            ):
-                one.image_1920 = one.content
+    thumbnail_state = fields.Selection(
+        selection=[("pending", "Pending"), ("done", "Done"), ("failed", "Failed")],
+        compute="_compute_thumbnail_state",
+        store=True,
+        index="btree_not_null",
+        copy=False,
+        help="Thumbnails of images, and previews of PDF and office documents, are "
+        "generated in the background.",
+    )
+
+    _sql_constraints = [
+        (
+            "directory_name_uniq",
+            "EXCLUDE USING btree (directory_id WITH =, name WITH =) WHERE (active)",
+            "A file with the same name already exists in this directory.",
+        )
+    ]
+
+    @api.depends("mimetype", "checksum")
+    def _compute_thumbnail_state(self):
+        """Enqueue the files whose content changed to generate their thumbnail."""
+        for one in self:
+            if self._has_thumbnail(one.mimetype):
+                one.thumbnail_state = "pending"
+            else:
+                one.thumbnail_state = False
+
+    @api.model
+    def _has_thumbnail(self, mimetype):
+        return thumbnail.is_image(mimetype) or preview.is_previewable(mimetype)
 
     def check_access(self, operation):
         self.mapped("directory_id").check_access(operation)
@@ -167,24 +197,8 @@ class DMSFile(models.Model):
         if self.access_token and consteq(self.access_token, access_token):
             return True
 
-        items = (
-            self.env["dms.directory"]
-            .sudo()
-            .search([("access_token", "=", access_token)])
-        )
-        if items:
-            item = items[0]
-            if self.directory_id.id == item.id:
-                return True
-            directory_item = self.directory_id
-            while directory_item.parent_id:
-                if directory_item.id == self.directory_id.id:
-                    return True
-                directory_item = directory_item.parent_id
-            # Fix last level
-            if directory_item.id == self.directory_id.id:
-                return True
-        return False
+        # The token of a directory gives access to the files of its subtree
+        return self.directory_id.check_access_token(access_token)
 
     res_model = fields.Char(
         string="Linked attachments model", related="directory_id.res_model"
@@ -210,22 +224,83 @@ class DMSFile(models.Model):
 
     @api.model
     def _get_content_inital_vals(self):
-        return {"content_binary": False, "content_file": False}
+        return {"content_binary": False, "content_file": False, "blob_id": False}
+
+    @api.model
+    def _read_raw_content(self, source):
+        """
+        Read raw content given as bytes or as a binary file object.
+
+        :param bytes|memoryview|io.BufferedIOBase source: The raw content.
+
+        :return: The raw content.
+        :rtype: bytes
+        """
+        if hasattr(source, "read"):
+            return source.read() or b""
+        return bytes(source or b"")
+
+    def _get_binary_vals(self, binary):
+        """Compute in a single pass all the values depending on the raw content."""
+        mimetype = guess_mimetype(binary)
+        return {
+            "checksum": self._get_checksum(binary),
+            "size": binary and len(binary) or 0,
+            "mimetype": mimetype,
+            "extension": file.guess_extension(self.name, mimetype, binary),
+        }
 
     def _update_content_vals(self, vals, binary):
         new_vals = vals.copy()
-        new_vals.update(
-            {
-                "checksum": self._get_checksum(binary),
-                "size": binary and len(binary) or 0,
-            }
-        )
-        if self.storage_id.save_type in ["file", "attachment"]:
-            new_vals["content_file"] = self.content
+        new_vals.update(self._get_binary_vals(binary))
+        storage = self.storage_id
+        if storage.deduplicate_content and storage.save_type in ["database", "file"]:
+            if binary:
+                new_vals["blob_id"] = (
+                    self.env["dms.blob"]
+                    ._get_or_create(new_vals["checksum"], storage.save_type, binary)
+                    .id
+                )
+        elif storage.save_type in ["file", "attachment"]:
+            # Stored from the raw content by _write_raw_content()
+            new_vals.pop("content_file", None)
         else:
-            new_vals["content_binary"] = self.content and binary
+            new_vals["content_binary"] = binary
         return new_vals
 
+    def _write_raw_content(self, binary):
+        """
+        Store raw content on the files of the recordset.
+
+        The content is never base64 encoded nor decoded, and the checksum, size,
+        mimetype and extension are computed from it at once.
+
+        :param bytes binary: The raw content.
+        """
+        updates = defaultdict(set)
+        blobs = self.sudo().blob_id
+        file_records = self.browse()
+        for record in self:
+            values = record._update_content_vals(
+                record._get_content_inital_vals(), binary
+            )
+            if values["checksum"] == record.checksum:
+                # The same content is moved, its thumbnail is kept
+                for key in ["checksum", "size", "mimetype", "extension"]:
+                    values.pop(key)
+            if "content_file" not in values:
+                file_records |= record
+            updates[tools.frozendict(values)].add(record.id)
+        if file_records:
+            self.env["ir.attachment"]._dms_set_raw(file_records, "content_file", binary)
+        self.invalidate_recordset(["content"])
+        for vals, ids in updates.items():
+            self.browse(ids).write(dict(vals))
+        blobs._gc_unreferenced()
+        if any(self._has_thumbnail(values.get("mimetype")) for values in updates):
+            # Generate the thumbnails in the background
+            self.env.ref("dms.ir_cron_dms_file_thumbnail").sudo()._trigger()
+
     @api.model
     def _get_binary_max_size(self):
         return int(
@@ -243,6 +318,385 @@ class DMSFile(models.Model):
     def _get_icon_placeholder_name(self):
         return self.extension and f"file_{self.extension}.svg" or ""
 
+    def _get_content_holder(self):
+        """Get the record holding the content of the file: itself or its blob."""
+        self.ensure_one()
+        return self.sudo().blob_id or self
+
+    def _get_content_attachment(self):
+        """Get the attachment holding the content of the file, if any."""
+        self.ensure_one()
+        if self.attachment_id:
+            return self.attachment_id.sudo()
+        holder = self._get_content_holder()
+        return (
+            self.env["ir.attachment"]
+            .sudo()
+            .search(
+                [
+                    ("res_model", "=", holder._name),
+                    ("res_field", "=", "content_file"),
+                    ("res_id", "=", holder.id),
+                ],
+                limit=1,
+            )
+        )
+
+    def _get_content_reader(self, cr=None):
+        """
+        Get a binary file object over the content of the file, without loading it
+        in memory as a whole.
+
+        Content stored in the filestore is opened from the disk, content stored in
+        the database is read in slices straight from the ``content_binary`` column.
+
+        :param odoo.sql_db.Cursor cr: The cursor to read the content stored in the
+        database with, to read content not committed yet.
+
+        :return: The file object and the size of the content in bytes.
+        :rtype: tuple[io.RawIOBase, int]
+        """
+        self.ensure_one()
+        attachment = self._get_content_attachment()
+        if attachment:
+            if attachment.store_fname:
+                path = attachment._full_path(attachment.store_fname)
+                return open(path, "rb"), os.path.getsize(path)
+            raw = attachment.raw or b""
+            return io.BytesIO(raw), len(raw)
+        holder = self._get_content_holder()
+        holder.flush_recordset(["content_binary"])
+        self.env.cr.execute(
+            SQL(
+                "SELECT octet_length(content_binary) FROM %s WHERE id = %s",
+                SQL.identifier(holder._table),
+                holder.id,
+            )
+        )
+        row = self.env.cr.fetchone()
+        size = row and row[0] or 0
+        reader = stream.DatabaseBinaryReader(
+            self.env.registry, holder._table, "content_binary", holder.id, size, cr=cr
+        )
+        return reader, size
+
+    def _migrate_content(self):
+        """
+        Move the content of the file to the save type of its storage. The raw
+        content is moved as is, without any base64 round trip.
+
+        :return: The size of the migrated content, in bytes.
+        :rtype: int
+        """
+        self.ensure_one()
+        # The content is read with the cursor of the migration, seeing the
+        # content not committed yet
+        reader, size = self._get_content_reader(cr=self.env.cr)
+        with reader:
+            # Read at once: the default buffered reads would query the database
+            # for every few kilobytes
+            binary = reader.read(size) if size else b""
+        if len(binary) != size:
+            raise UserError(
+                _(
+                    "The content of the file %(name)s could not be read: "
+                    "%(read)s bytes read out of %(size)s.",
+                    name=self.display_name,
+                    read=len(binary),
+                    size=size,
+                )
+            )
+        self._write_raw_content(binary)
+        # Writing the storage recomputes the migration status
+        self.write({"storage_id": self.directory_id.storage_id.id})
+        return size
+
+    def _migrate_contents(self):
+        """
+        Move the content of the files to the save type of their storage.
+
+        The content of the files moving from the database to the filestore is
+        streamed straight from the ``content_binary`` column to the filestore,
+        and the column is emptied for all of them at once. The other files are
+        migrated one by one.
+
+        :return: The size of the migrated content, in bytes.
+        :rtype: int
+        """
+
+        def is_direct(record):
+            return (
+                record.directory_id.storage_id.save_type == "file"
+                and not record.directory_id.storage_id.deduplicate_content
+                and not record.sudo().blob_id
+                and not record.attachment_id
+                and record.save_type == "database"
+            )
+
+        direct = self.filtered(is_direct)
+        size = sum(record._migrate_content() for record in self - direct)
+        if not direct:
+            return size
+        direct.flush_recordset(["content_binary"])
+        lengths = dict(
+            self.env.execute_query(
+                SQL(
+                    """
+                    SELECT id, octet_length(content_binary)
+                    FROM dms_file WHERE id = ANY(%s)
+                    """,
+                    direct.ids,
+                )
+            )
+        )
+        vals_list = []
+        for record in direct:
+            length = lengths.get(record.id) or 0
+            if not length:
+                # Empty content is not stored in the filestore
+                continue
+            fname, checksum = record._stream_content_to_filestore(length)
+            size += length
+            vals_list.append(
+                {
+                    "name": "content_file",
+                    "res_model": record._name,
+                    "res_field": "content_file",
+                    "res_id": record.id,
+                    "type": "binary",
+                    "store_fname": fname,
+                    "file_size": length,
+                    "checksum": checksum,
+                    "mimetype": record.mimetype,
+                }
+            )
+        self.env["ir.attachment"].sudo().with_context(dms_file=True).create(vals_list)
+        self.env.cr.execute(
+            SQL(
+                "UPDATE dms_file SET content_binary = NULL WHERE id = ANY(%s)",
+                direct.ids,
+            )
+        )
+        # The save type is computed from the content fields, but not recomputed
+        # when they are invalidated
+        direct.invalidate_recordset(
+            ["content_binary", "content_file", "content", "save_type"]
+        )
+        # Writing the storage recomputes the migration status
+        storages = direct.grouped(lambda record: record.directory_id.storage_id)
+        for storage, records in storages.items():
+            records.write({"storage_id": storage.id})
+        return size
+
+    def _stream_content_to_filestore(self, length):
+        """
+        Copy the content of the ``content_binary`` column of the file to the
+        filestore by chunks, at the path given by its checksum.
+
+        :param int length: The size of the content, in bytes.
+
+        :return: The name of the file in the filestore and its checksum.
+        :rtype: tuple[str, str]
+        """
+        self.ensure_one()
+        attachment_model = self.env["ir.attachment"]
+        os.makedirs(attachment_model._filestore(), exist_ok=True)
+        reader = stream.DatabaseBinaryReader(
+            self.env.registry,
+            self._table,
+            "content_binary",
+            self.id,
+            length,
+            cr=self.env.cr,
+        )
+        sha1 = hashlib.sha1()
+        with (
+            reader,
+            tempfile.NamedTemporaryFile(
+                dir=attachment_model._filestore(), delete=False
+            ) as temp,
+        ):
+            try:
+                while chunk := reader.read(stream.CHUNK_SIZE):
+                    sha1.update(chunk)
+                    temp.write(chunk)
+            except Exception:
+                os.unlink(temp.name)
+                raise
+        checksum = sha1.hexdigest()
+        if self.checksum and self.checksum != checksum:
+            _logger.warning(
+                "The checksum of the file %s does not match its content", self.id
+            )
+        fname = f"{checksum[:2]}/{checksum}"
+        full_path = attachment_model._full_path(fname)
+        if os.path.isfile(full_path):
+            # The same content is already stored
+            os.unlink(temp.name)
+        else:
+            os.makedirs(os.path.dirname(full_path), exist_ok=True)
+            os.replace(temp.name, full_path)
+        # Garbage collected unless the transaction creating its attachment is
+        # committed
+        attachment_model._mark_for_gc(fname)
+        return fname, checksum
+
+    @api.model
+    def _get_thumbnail_workers(self):
+        get_param = self.env["ir.config_parameter"].sudo().get_param
+        return int(get_param("dms.thumbnail_workers", default=2))
+
+    @api.model
+    def _get_preview_timeout(self):
+        get_param = self.env["ir.config_parameter"].sudo().get_param
+        return int(get_param("dms.preview_timeout", default=preview.PREVIEW_TIMEOUT))
+
+    def _get_cached_thumbnails(self):
+        """
+        Get the thumbnails already generated for the contents of the recordset,
+        so that a content stored several times is only rendered once.
+
+        :return: The thumbnails in base64 by checksum.
+        :rtype: dict[str, bytes]
+        """
+        checksums = {checksum for checksum in self.mapped("checksum") if checksum}
+        if not checksums:
+            return {}
+        files = self.with_context(active_test=False).search(
+            [
+                ("checksum", "in", list(checksums)),
+                ("thumbnail_state", "=", "done"),
+                ("id", "not in", self.ids),
+            ]
+        )
+        cache = {}
+        for checksum, records in files.grouped("checksum").items():
+            image = records[:1].image_1920
+            if image:
+                cache[checksum] = image
+        return cache
+
+    def _generate_thumbnails(self, executor=None):
+        """
+        Generate the thumbnails of the recordset. The images are downscaled, and
+        the first page of the other documents rendered, by the worker threads
+        of the executor, if any, and the derived sizes are then computed from
+        the downscaled images. Files sharing their content with a file whose
+        thumbnail was already generated reuse it, and files of the recordset
+        sharing their content are only rendered once.
+
+        The content of a file is only read when its rendering is submitted, and
+        a few renderings per worker are in flight at once, so that the contents
+        of the whole recordset are never held in memory together.
+
+        :param concurrent.futures.Executor executor: The executor of the workers.
+        """
+        cache = self._get_cached_thumbnails()
+        timeout = self._get_preview_timeout()
+        max_in_flight = max(self._get_thumbnail_workers(), 1) * 2
+        in_flight = deque()
+
+        def store_next():
+            rendered, future = in_flight.popleft()
+            rendered._store_thumbnail(lambda: base64.b64encode(future.result()))
+
+        groups = self.grouped(lambda record: record.checksum or record.id)
+        for key, records in groups.items():
+            if key in cache:
+                records._store_thumbnail(lambda image=cache[key]: image)
+                continue
+            function, *args = records[0]._get_thumbnail_call(timeout)
+            if not executor:
+                records._store_thumbnail(lambda: base64.b64encode(function(*args)))
+                continue
+            in_flight.append((records, executor.submit(function, *args)))
+            if len(in_flight) >= max_in_flight:
+                store_next()
+        while in_flight:
+            store_next()
+
+    def _get_thumbnail_call(self, timeout):
+        """
+        Read the content of the file and get the call rendering its thumbnail.
+
+        :param int timeout: The maximum duration of the rendering of a preview.
+
+        :return: The function rendering the thumbnail, and its arguments.
+        :rtype: tuple
+        """
+        self.ensure_one()
+        reader, size = self._get_content_reader(cr=self.env.cr)
+        with reader:
+            raw = reader.read(size) if size else b""
+        if thumbnail.is_image(self.mimetype):
+            return (thumbnail.process_image, raw)
+        return (preview.render_preview, raw, self.mimetype, timeout)
+
+    def _store_thumbnail(self, get_image):
+        """
+        Store the thumbnail of files sharing the same content, or mark them as
+        failed when it can not be rendered.
+
+        :param callable get_image: Get the thumbnail, encoded in base64.
+        """
+        try:
+            with self.env.cr.savepoint():
+                image = get_image()
+                self.write({"image_1920": image or False, "thumbnail_state": "done"})
+        except Exception:
+            _logger.warning(
+                "Failed to generate the thumbnail of the files %s",
+                self.ids,
+                exc_info=True,
+            )
+            self.thumbnail_state = "failed"
+
+    @api.model
+    def _cron_generate_thumbnails(self, limit=1000, batch_size=50):
+        """Generate the pending thumbnails by batches, with a pool of threads: the
+        images are downscaled by Pillow, releasing the GIL, and the previews are
+        rendered by programs run in their own process. The rendering of each
+        preview is bounded by the preview timeout. No process is forked, as the
+        scheduled action runs in a server holding connections and locks."""
+        files = self.with_context(active_test=False).sudo()
+        records = files.search([("thumbnail_state", "=", "pending")], limit=limit)
+        # Files are processed inline while testing, and batches are only
+        # committed outside of tests
+        testing = bool(module.current_test)
+        workers = self._get_thumbnail_workers()
+        executor = None
+        if workers > 0 and not testing:
+            executor = ThreadPoolExecutor(max_workers=workers)
+        try:
+            for batch in tools.split_every(batch_size, records.ids, files.browse):
+                batch._generate_thumbnails(executor)
+                if not testing:
+                    self.env.cr.commit()
+        finally:
+            if executor:
+                executor.shutdown()
+        if len(records) == limit:
+            # More thumbnails are probably pending
+            self.env.ref("dms.ir_cron_dms_file_thumbnail").sudo()._trigger()
+
+    @api.model
+    def _cron_backfill_thumbnails(self, limit=10000):
+        """Enqueue the existing files whose thumbnail was never generated, such
+        as the documents stored before their preview could be rendered."""
+        mimetypes = thumbnail.get_image_mimetypes() | preview.get_preview_mimetypes()
+        files = self.with_context(active_test=False).sudo()
+        records = files.search(
+            [("thumbnail_state", "=", False), ("mimetype", "in", list(mimetypes))],
+            limit=limit,
+        )
+        if not records:
+            return
+        records.thumbnail_state = "pending"
+        _logger.info("Enqueued the thumbnails of %s files", len(records))
+        self.env.ref("dms.ir_cron_dms_file_thumbnail").sudo()._trigger()
+        if len(records) == limit:
+            self.env.ref("dms.ir_cron_dms_file_thumbnail_backfill").sudo()._trigger()
+
     # Actions
     def action_migrate(self, should_logging=True):
         record_count = len(self)
@@ -259,12 +713,7 @@ class DMSFile(models.Model):
                     )
                 )
                 index += 1
-            dms_file.write(
-                {
-                    "content": dms_file.with_context(**{}).content,
-                    "storage_id": dms_file.directory_id.storage_id.id,
-                }
-            )
+            dms_file._migrate_contents()
 
     def action_save_onboarding_file_step(self):
         self.env.user.company_id.set_onboarding_step_done(
@@ -402,27 +851,39 @@ class DMSFile(models.Model):
     @api.depends("name", "directory_id", "directory_id.parent_path")
     def _compute_path(self):
         model = self.env["dms.directory"]
+        # Resolve the ancestors of the stored directories from their parent path,
+        # and read all their names at once
+        paths = {}
+        for directory in self.directory_id:
+            if isinstance(directory.id, int) and directory.parent_path:
+                paths[directory.id] = [
+                    int(directory_id)
+                    for directory_id in directory.parent_path.split("/")
+                    if directory_id
+                ]
+        ancestors = model.browse({id_ for path in paths.values() for id_ in path})
+        names = dict(zip(ancestors.ids, ancestors.mapped("name"), strict=True))
         for record in self:
-            path_names = [record.display_name]
+            directory = record.directory_id
+            if directory.id in paths:
+                path = [(id_, names[id_]) for id_ in paths[directory.id]]
+            else:
+                path = []
+                while directory:
+                    path.append((directory._origin.id, directory.name))
+                    directory = directory.parent_id
+                path.reverse()
+            path_names = [name for _id, name in path] + [record.display_name]
             path_json = [
+                {"model": model._name, "name": name, "id": id_} for id_, name in path
+            ]
+            path_json.append(
                 {
                     "model": record._name,
                     "name": record.display_name,
                     "id": isinstance(record.id, int) and record.id or 0,
                 }
-            ]
-            current_dir = record.directory_id
-            while current_dir:
-                path_names.insert(0, current_dir.name)
-                path_json.insert(
-                    0,
-                    {
-                        "model": model._name,
-                        "name": current_dir.name,
-                        "id": current_dir._origin.id,
-                    },
-                )
-                current_dir = current_dir.parent_id
+            )
             record.update(
                 {
                     "path_names": "/".join(path_names) if all(path_names) else "",
@@ -448,32 +909,34 @@ class DMSFile(models.Model):
         for item in self:
             item.human_size = human_size(item.size)
 
-    @api.depends("content_binary", "content_file", "attachment_id")
+    @api.depends("content_binary", "content_file", "attachment_id", "blob_id")
     def _compute_content(self):
         bin_size = self.env.context.get("bin_size", False)
         for record in self:
-            if record.content_file:
+            # Deduplicated content is read from the shared blob
+            holder = record.blob_id.sudo() or record
+            if holder.content_file:
                 context = {"human_size": True} if bin_size else {"base64": True}
-                record.content = record.with_context(**context).content_file
-            elif record.content_binary:
+                record.content = holder.with_context(**context).content_file
+            elif holder.content_binary:
                 record.content = (
-                    record.content_binary
+                    holder.content_binary
                     if bin_size
-                    else base64.b64encode(record.content_binary)
+                    else base64.b64encode(holder.content_binary)
                 )
             elif record.attachment_id:
                 context = {"human_size": True} if bin_size else {"base64": True}
                 record.content = record.with_context(**context).attachment_id.datas
 
-    @api.depends("content_binary", "content_file")
+    @api.depends("content_binary", "content_file", "blob_id")
     def _compute_save_type(self):
         for record in self:
-            if record.content_file:
+            if record.content_file or record.sudo().blob_id.save_type == "file":
                 record.save_type = "file"
             else:
                 record.save_type = "database"
 
-    @api.depends("storage_id", "storage_id.save_type")
+    @api.depends("storage_id", "storage_id.save_type", "size")
     def _compute_migration(self):
         storage_model = self.env["dms.storage"]
         save_field = storage_model._fields["save_type"]
@@ -481,7 +944,12 @@ class DMSFile(models.Model):
         selection = {value[0]: value[1] for value in values}
         for record in self:
             storage_type = record.storage_id.save_type
-            if storage_type == "attachment" or storage_type == record.save_type:
+            # An empty content is stored nowhere, so it has nothing to migrate
+            if (
+                storage_type == "attachment"
+                or storage_type == record.save_type
+                or not record.size
+            ):
                 record.migration = selection.get(storage_type)
                 record.require_migration = False
             else:
@@ -513,41 +981,39 @@ class DMSFile(models.Model):
         for record in self:
             if not file.check_name(record.name):
                 raise ValidationError(_("The file name is invalid."))
-            files = record.sudo().directory_id.file_ids
-            if files.filtered(
-                lambda file, record=record: file.name == record.name and file != record
-            ):
-                raise ValidationError(
-                    _("A file with the same name already exists in this directory.")
-                )
+
+    @contextmanager
+    def _check_name_unique(self):
+        """Raise a validation error when the names of the active files of a
+        directory are not unique, which is enforced by the database."""
+        try:
+            with self.env.cr.savepoint():
+                yield
+        except errors.ExclusionViolation as error:
+            if error.diag.constraint_name != f"{self._table}_directory_name_uniq":
+                raise
+            raise ValidationError(
+                _("A file with the same name already exists in this directory.")
+            ) from None
 
     @api.constrains("extension")
     def _check_extension(self):
+        forbidden_extensions = self._get_forbidden_extensions()
         if self.filtered(
-            lambda rec: rec.extension
-            and rec.extension in self._get_forbidden_extensions()
+            lambda rec: rec.extension and rec.extension in forbidden_extensions
         ):
             raise ValidationError(_("The file has a forbidden file extension."))
 
     @api.constrains("size")
     def _check_size(self):
-        if self.filtered(
-            lambda rec: rec.size > self._get_binary_max_size() * 1024 * 1024
-        ):
-            raise ValidationError(
-                _("The maximum upload size is %s MB.") % self._get_binary_max_size()
-            )
+        max_size = self._get_binary_max_size()
+        if self.filtered(lambda rec: rec.size > max_size * 1024 * 1024):
+            raise ValidationError(_("The maximum upload size is %s MB.") % max_size)
 
     # Create, Update, Delete
     def _inverse_content(self):
-        updates = defaultdict(set)
-        for record in self:
-            values = self._get_content_inital_vals()
-            binary = base64.b64decode(record.content or "")
-            values = record._update_content_vals(values, binary)
-            updates[tools.frozendict(values)].add(record.id)
-        for vals, ids in updates.items():
-            self.browse(ids).write(dict(vals))
+        for content, records in self.grouped("content").items():
+            records._write_raw_content(base64.b64decode(content or ""))
 
     def _create_model_attachment(self, vals):
         res_vals = vals.copy()
@@ -564,22 +1030,25 @@ class DMSFile(models.Model):
             and directory.res_id
             and directory.storage_id_save_type == "attachment"
         ):
+            attachment_vals = {
+                "name": vals["name"],
+                "res_model": directory.res_model,
+                "res_id": directory.res_id,
+            }
+            if "content_raw" in res_vals:
+                attachment_vals["raw"] = self._read_raw_content(
+                    res_vals.pop("content_raw")
+                )
+            else:
+                attachment_vals["datas"] = res_vals.pop("content")
             attachment = (
                 self.env["ir.attachment"]
                 .with_context(dms_file=True)
-                .create(
-                    {
-                        "name": vals["name"],
-                        "datas": vals["content"],
-                        "res_model": directory.res_model,
-                        "res_id": directory.res_id,
-                    }
-                )
+                .create(attachment_vals)
             )
             res_vals["attachment_id"] = attachment.id
             res_vals["res_model"] = attachment.res_model
             res_vals["res_id"] = attachment.res_id
-            del res_vals["content"]
         return res_vals
 
     def copy_data(self, default=None):
@@ -595,16 +1064,180 @@ class DMSFile(models.Model):
 
     @api.model_create_multi
     def create(self, vals_list):
+        """Create files.
+
+        Besides the base64 encoded ``content``, the content can be given as raw
+        bytes or as a binary file object with the ``content_raw`` key.
+        """
         new_vals_list = []
+        raw_contents = []
         for vals in vals_list:
             if "attachment_id" not in vals:
                 vals = self._create_model_attachment(vals)
+            vals = dict(vals)
+            raw_contents.append(vals.pop("content_raw", None))
             new_vals_list.append(vals)
-        return super().create(new_vals_list)
+        # The content written while creating the files is not tracked by the
+        # directory totals, the files being added once with their content
+        model = self.with_context(dms_rollup_untracked=True)
+        with self._check_name_unique():
+            records = super(DMSFile, model).create(new_vals_list)
+        for record, raw in zip(records, raw_contents, strict=True):
+            if raw is not None:
+                record._write_raw_content(self._read_raw_content(raw))
+        records = records.with_env(self.env)
+        self.env["dms.directory.rollup"]._add_files(records)
+        return records
+
+    def write(self, vals):
+        write_raw = "content_raw" in vals
+        if write_raw:
+            vals = dict(vals)
+            raw = vals.pop("content_raw")
+        rollup = self.env["dms.directory.rollup"]
+        if any(key in vals for key in ["name", "directory_id", "active"]):
+            with self._check_name_unique(), rollup._track_files(self, vals):
+                res = super().write(vals)
+        else:
+            with rollup._track_files(self, vals):
+                res = super().write(vals)
+        if write_raw:
+            self._write_raw_content(self._read_raw_content(raw))
+        return res
+
+    @api.model
+    def bulk_create(self, vals_list, batch_size=500):
+        """
+        Create a large number of files at once.
+
+        Files are validated and inserted by batches: configuration parameters are
+        read once, name uniqueness is checked with a single query per batch and
+        rows are inserted together. A file that can not be created is reported
+        instead of aborting the whole import. Creation messages and tracking are
+        disabled, as for data imports.
+
+        :param list vals_list: The values of the files to create. The content can
+        be given with either the ``content`` or the ``content_raw`` key.
+        :param int batch_size: The number of files validated and inserted together.
+
+        :return: The ids of the created files, and the errors of the files that
+        could not be created, with their index in ``vals_list``.
+        :rtype: dict
+        """
+        max_size = self._get_binary_max_size() * 1024 * 1024
+        forbidden_extensions = self._get_forbidden_extensions()
+        model = self.with_context(tracking_disable=True, mail_create_nolog=True)
+        result = {"ids": [], "errors": []}
+        for start in range(0, len(vals_list), batch_size):
+            batch = []
+            for index, vals in enumerate(vals_list[start : start + batch_size], start):
+                try:
+                    vals = model._bulk_prepare_vals(
+                        vals, max_size, forbidden_extensions
+                    )
+                except (UserError, binascii.Error) as error:
+                    result["errors"].append(self._bulk_error(index, vals, error))
+                    continue
+                batch.append((index, vals))
+            batch = model._bulk_check_names(batch, result["errors"])
+            result["ids"] += model._bulk_insert(batch, result["errors"])
+        result["errors"].sort(key=lambda error: error["index"])
+        return result
+
+    @api.model
+    def _bulk_error(self, index, vals, error):
+        return {"index": index, "name": vals.get("name"), "message": str(error)}
+
+    @api.model
+    def _bulk_prepare_vals(self, vals, max_size, forbidden_extensions):
+        """Validate the values of a file to import, decoding its content once."""
+        vals = dict(vals)
+        if not vals.get("directory_id"):
+            vals["directory_id"] = self.env.context.get("default_directory_id")
+        if not vals.get("directory_id"):
+            raise ValidationError(_("A file has to be created in a directory."))
+        name = vals.get("name")
+        if not name or not file.check_name(name):
+            raise ValidationError(_("The file name is invalid."))
+        if "content_raw" in vals:
+            binary = self._read_raw_content(vals.pop("content_raw"))
+        else:
+            binary = base64.b64decode(vals.pop("content", None) or b"")
+        if len(binary) > max_size:
+            raise ValidationError(
+                _("The maximum upload size is %s MB.") % (max_size // 1024 // 1024)
+            )
+        extension = file.guess_extension(name, guess_mimetype(binary), binary)
+        if extension and extension in forbidden_extensions:
+            raise ValidationError(_("The file has a forbidden file extension."))
+        vals["content_raw"] = binary
+        return vals
+
+    @api.model
+    def _bulk_check_names(self, batch, errors):
+        """Discard the files whose name is already used in their directory, by
+        the existing files or by a previous file of the batch."""
+        if not batch:
+            return batch
+        self.flush_model(["name", "directory_id", "active"])
+        self.env.cr.execute(
+            SQL(
+                """
+                SELECT directory_id, name
+                FROM dms_file
+                WHERE active AND directory_id = ANY(%s) AND name = ANY(%s)
+                """,
+                list({vals["directory_id"] for _index, vals in batch}),
+                list({vals["name"] for _index, vals in batch}),
+            )
+        )
+        used_names = set(self.env.cr.fetchall())
+        valid = []
+        for index, vals in batch:
+            key = (vals["directory_id"], vals["name"])
+            if key in used_names:
+                error = ValidationError(
+                    _("A file with the same name already exists in this directory.")
+                )
+                errors.append(self._bulk_error(index, vals, error))
+                continue
+            used_names.add(key)
+            valid.append((index, vals))
+        return valid
+
+    @api.model
+    def _bulk_insert(self, batch, errors):
+        """Insert the files of a batch at once, falling back to one by one to
+        isolate the failing files when the batch can not be inserted."""
+        if not batch:
+            return []
+        try:
+            with self.env.cr.savepoint():
+                records = self.create([vals for _index, vals in batch])
+                self.env.flush_all()
+            return records.ids
+        except (UserError, psycopg2.Error) as error:
+            if len(batch) == 1:
+                index, vals = batch[0]
+                errors.append(self._bulk_error(index, vals, error))
+                return []
+        ids = []
+        for index, vals in batch:
+            try:
+                with self.env.cr.savepoint():
+                    record = self.create(vals)
+                    self.env.flush_all()
+                ids.append(record.id)
+            except (UserError, psycopg2.Error) as error:
+                errors.append(self._bulk_error(index, vals, error))
+        return ids
 
     def unlink(self):
         attachments = self.mapped("attachment_id")
+        blobs = self.sudo().blob_id
+        self.env["dms.directory.rollup"]._remove_files(self)
         res = super().unlink()
+        blobs._gc_unreferenced()
         if not self.env.context.get("dms_file"):
             attachments.with_context(dms_file=True).unlink()
         return res
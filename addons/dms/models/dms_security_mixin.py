@@ -9,15 +9,20 @@ from logging import getLogger
 from odoo import api, fields, models
 from odoo.exceptions import AccessError
 from odoo.osv.expression import (
+    AND,
     FALSE_DOMAIN,
     NEGATIVE_TERM_OPERATORS,
     OR,
     TRUE_DOMAIN,
 )
-from odoo.tools import SQL
+from odoo.tools import SQL, ormcache
 
 _logger = getLogger(__name__)
 
+# Above this number of accessible directories, the access groups are applied
+# with a subquery instead of a list of cached ids
+ACCESS_DIRECTORIES_CACHE_LIMIT = 1000
+
 
 class DmsSecurityMixin(models.AbstractModel):
     _name = "dms.security.mixin"
@@ -72,7 +77,11 @@ class DmsSecurityMixin(models.AbstractModel):
 
     def _compute_permissions(self):
         """
-        Get permissions for the current record.
+        Get permissions for the current records.
+
+        The four permissions of the whole recordset are resolved with a single
+        query, selecting for each operation whether the record matches the
+        record rules of the operation.
         """
 
         # Update according to presence when applying ir.rule
@@ -88,20 +97,63 @@ class DmsSecurityMixin(models.AbstractModel):
             )
             return
 
-        creatable = self._filtered_access("create")
-        readable = self._filtered_access("read")
-        unlinkable = self._filtered_access("unlink")
-        writeable = self._filtered_access("write")
+        operations = ["create", "read", "unlink", "write"]
+        permissions = {}
+        records = self._origin
+        if not records._get_inherited_access_records():
+            # Avoid computing the accessible related records for nothing
+            records = records.with_context(dms_skip_inherited_access=True)
+        if records:
+            rows = self.env.execute_query(
+                SQL(
+                    "SELECT id, %s FROM %s WHERE id = ANY(%s)",
+                    SQL(", ").join(
+                        records._get_permission_query(operation)
+                        for operation in operations
+                    ),
+                    SQL.identifier(self._table),
+                    records.ids,
+                )
+            )
+            permissions = {row[0]: row[1:] for row in rows}
         for one in self:
+            values = permissions.get(one._origin.id, (False,) * len(operations))
             one.update(
                 {
-                    "permission_create": bool(one & creatable),
-                    "permission_read": bool(one & readable),
-                    "permission_unlink": bool(one & unlinkable),
-                    "permission_write": bool(one & writeable),
+                    f"permission_{operation}": value
+                    for operation, value in zip(operations, values, strict=True)
                 }
             )
 
+    def _get_permission_query(self, operation):
+        """Get the SQL expression telling whether a record of the recordset is
+        accessible for the given operation, applying access rights and rules."""
+        if not self.env["ir.model.access"].check(
+            self._name, operation, raise_exception=False
+        ):
+            return SQL("FALSE")
+        domain = self.env["ir.rule"]._compute_domain(self._name, operation)
+        if not domain:
+            return SQL("TRUE")
+        # Same as when the rules are applied: the permission domains are searched
+        # with sudo for the current user
+        model = self.sudo().with_context(active_test=False)
+        # Only the records of the recordset are checked against the rules
+        domain = AND([[("id", "in", self.ids)], domain])
+        return SQL(
+            "%s IN %s",
+            SQL.identifier(self._table, "id"),
+            model._search(domain).subselect(),
+        )
+
+    def _get_inherited_access_records(self):
+        """Get the records of the recordset inheriting their access from the
+        record they are linked to."""
+        inherited_access_field = "storage_id_inherit_access_from_parent_record"
+        if self._name != "dms.directory":
+            inherited_access_field = f"{self._directory_field}.{inherited_access_field}"
+        return self.sudo().filtered(inherited_access_field)
+
     @api.model
     def _get_domain_by_inheritance(self, operation):
         """Get domain for inherited accessible records."""
@@ -115,12 +167,21 @@ class DmsSecurityMixin(models.AbstractModel):
             (inherited_access_field, "=", True),
         ]
         domains = []
-        # Get all used related records
-        related_groups = self.sudo().read_group(
-            domain=inherited_access_domain + [("res_model", "!=", False)],
-            fields=["res_id:array_agg"],
-            groupby=["res_model"],
-        )
+        subquery = self._get_inherited_access_mode() == "subquery"
+        if subquery:
+            related_groups = [
+                {"res_model": res_model}
+                for res_model in self._get_inherited_access_models(
+                    inherited_access_domain
+                )
+            ]
+        else:
+            # Get all used related records
+            related_groups = self.sudo().read_group(
+                domain=inherited_access_domain + [("res_model", "!=", False)],
+                fields=["res_id:array_agg"],
+                groupby=["res_model"],
+            )
         for group in related_groups:
             try:
                 model = self.env[group["res_model"]]
@@ -142,6 +203,12 @@ class DmsSecurityMixin(models.AbstractModel):
             except AccessError:
                 continue
             domains.append([("res_model", "=", model._name), ("res_id", "=", False)])
+            if subquery:
+                related_query = self._get_related_access_query(model, operation)
+                domains.append(
+                    [("res_model", "=", model._name), ("res_id", "in", related_query)]
+                )
+                continue
             # Check record access in batch too
             res_ids = [i for i in group["res_id"] if i]  # Hack to remove None res_id
             # Apply exists to skip records that do not exist. (e.g. a res.partner
@@ -156,6 +223,40 @@ class DmsSecurityMixin(models.AbstractModel):
         result = inherited_access_domain + OR(domains)
         return result
 
+    @api.model
+    def _get_inherited_access_mode(self):
+        """Get how the access inherited from linked records is applied: with the
+        list of accessible linked records (``ids``, default), or with a subquery
+        selecting them (``subquery``), which keeps the domains small when many
+        records are linked."""
+        get_param = self.env["ir.config_parameter"].sudo().get_param
+        return get_param("dms.inherited_access_mode", "ids")
+
+    @api.model
+    def _get_inherited_access_models(self, inherited_access_domain):
+        """Get the models of the records linked to records inheriting their
+        access. They are cached for the transaction."""
+        cache = self.env.cr.cache.setdefault("dms_inherited_access_models", {})
+        if self._name not in cache:
+            groups = self.sudo()._read_group(
+                inherited_access_domain + [("res_model", "!=", False)],
+                groupby=["res_model"],
+            )
+            cache[self._name] = [res_model for (res_model,) in groups]
+        return cache[self._name]
+
+    @api.model
+    def _invalidate_inherited_access_models(self):
+        self.env.cr.cache.pop("dms_inherited_access_models", None)
+
+    @api.model
+    def _get_related_access_query(self, model, operation):
+        """Get the subquery selecting the records of a linked model accessible
+        for the given operation, applying its record rules."""
+        domain = self.env["ir.rule"]._compute_domain(model._name, operation)
+        related_model = model.sudo().with_context(active_test=False)
+        return related_model._search(domain or []).subselect()
+
     @api.model
     def _get_access_groups_query(self, operation):
         """Return the query to select access groups."""
@@ -183,6 +284,41 @@ class DmsSecurityMixin(models.AbstractModel):
         )
         return sql
 
+    @api.model
+    def _get_access_directories(self, operation):
+        """
+        Get the directories accessible applying DMS access groups.
+
+        :param str operation: The operation to check.
+
+        :return: The ids of the directories, cached by user and operation, or a
+        subquery selecting them when there are too many of them.
+        :rtype: list|odoo.tools.SQL
+        """
+        directory_ids = self._get_access_directory_ids(operation)
+        if directory_ids is None:
+            return self._get_access_groups_query(operation)
+        return list(directory_ids)
+
+    @api.model
+    @ormcache("self.env.uid", "operation")
+    def _get_access_directory_ids(self, operation):
+        """Cache of the directories accessible applying DMS access groups. It is
+        cleared whenever the access groups, their users or their directories
+        change."""
+        self.env["dms.access.group"].flush_model()
+        self.env["dms.directory"].flush_model(["complete_group_ids"])
+        rows = self.env.execute_query(
+            SQL(
+                "SELECT DISTINCT aid FROM %s AS access LIMIT %s",
+                self._get_access_groups_query(operation),
+                ACCESS_DIRECTORIES_CACHE_LIMIT + 1,
+            )
+        )
+        if len(rows) > ACCESS_DIRECTORIES_CACHE_LIMIT:
+            return None
+        return tuple(row[0] for row in rows)
+
     @api.model
     def _get_domain_by_access_groups(self, operation):
         """Get domain for records accessible applying DMS access groups."""
@@ -195,7 +331,7 @@ class DmsSecurityMixin(models.AbstractModel):
             (
                 self._directory_field,
                 "in",
-                self._get_access_groups_query(operation),
+                self._get_access_directories(operation),
             ),
         ]
         return result
@@ -216,12 +352,10 @@ class DmsSecurityMixin(models.AbstractModel):
             # You're SUPERUSER_ID
             return TRUE_DOMAIN if positive else FALSE_DOMAIN
 
-        result = OR(
-            [
-                _self._get_domain_by_access_groups(operation),
-                _self._get_domain_by_inheritance(operation),
-            ]
-        )
+        domains = [_self._get_domain_by_access_groups(operation)]
+        if not self.env.context.get("dms_skip_inherited_access"):
+            domains.append(_self._get_domain_by_inheritance(operation))
+        result = OR(domains)
         if not positive:
             result.insert(0, "!")
         return result
@@ -297,12 +431,19 @@ class DmsSecurityMixin(models.AbstractModel):
         # Go back to the original sudo state and check we really had creation permission
         res = res.sudo(self.env.su)
         res._check_access_dms_record("create")
+        self._invalidate_inherited_access_models()
         return res
 
     def write(self, vals):
         self._check_access_dms_record("write")
+        if any(
+            key in vals
+            for key in ["res_model", "model_id", "storage_id", self._directory_field]
+        ):
+            self._invalidate_inherited_access_models()
         return super().write(vals)
 
     def unlink(self):
         self._check_access_dms_record("unlink")
+        self._invalidate_inherited_access_models()
         return super().unlink()
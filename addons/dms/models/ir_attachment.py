@@ -8,9 +8,11 @@ class IrAttachment(models.Model):
     _inherit = "ir.attachment"
 
     def _get_dms_directories(self, res_model, res_id):
+        """Get the directories linked to a record, or to several records when
+        a list of ids is given."""
         domain = [
             ("res_model", "=", res_model),
-            ("res_id", "=", res_id),
+            ("res_id", "in" if isinstance(res_id, list) else "=", res_id),
             ("storage_id.save_type", "=", "attachment"),
         ]
         if self.env.context.get("attaching_to_record"):
@@ -18,22 +20,61 @@ class IrAttachment(models.Model):
         return self.env["dms.directory"].search(domain)
 
     def _dms_directories_create(self):
-        items = self.sudo()._get_dms_directories(self.res_model, False)
-        for item in items:
-            model_item = self.env[self.res_model].browse(self.res_id)
-            ir_model_item = (
-                self.env["ir.model"].sudo().search([("model", "=", self.res_model)])
+        """Create the directories of the records linked to the attachments, in
+        every directory of the storages linked to their model."""
+        directory_model = self.env["dms.directory"].sudo()
+        for res_model, attachments in self.grouped("res_model").items():
+            parents = self.sudo()._get_dms_directories(res_model, False)
+            if not parents:
+                continue
+            model_id = self.env["ir.model"]._get_id(res_model)
+            records = self.env[res_model].browse(set(attachments.mapped("res_id")))
+            directory_model.with_context(check_name=False).create(
+                [
+                    {
+                        "name": record.display_name,
+                        "model_id": model_id,
+                        "res_model": res_model,
+                        "res_id": record.id,
+                        "parent_id": parent.id,
+                        "storage_id": parent.storage_id.id,
+                    }
+                    for record in records
+                    for parent in parents
+                ]
             )
-            self.env["dms.directory"].sudo().with_context(check_name=False).create(
-                {
-                    "name": model_item.display_name,
-                    "model_id": ir_model_item.id,
-                    "res_model": self.res_model,
-                    "res_id": self.res_id,
-                    "parent_id": item.id,
-                    "storage_id": item.storage_id.id,
-                }
+
+    @api.model
+    def _dms_set_raw(self, records, field_name, raw):
+        """Store raw content in the attachment-based binary field of some records.
+
+        Writing the field itself requires base64 encoded content, which would be
+        decoded again by the attachment. This creates the attachments directly
+        from the raw content instead.
+        """
+        attachments = self.sudo().with_context(dms_file=True)
+        attachments.search(
+            [
+                ("res_model", "=", records._name),
+                ("res_field", "=", field_name),
+                ("res_id", "in", records.ids),
+            ]
+        ).unlink()
+        if raw:
+            attachments.create(
+                [
+                    {
+                        "name": field_name,
+                        "res_model": records._name,
+                        "res_field": field_name,
+                        "res_id": record.id,
+                        "type": "binary",
+                        "raw": raw,
+                    }
+                    for record in records
+                ]
             )
+        records.invalidate_recordset([field_name])
 
     @ormcache("model")
     def _dms_operations_from_model(self, model):
@@ -45,51 +86,74 @@ class IrAttachment(models.Model):
         """Perform the operation only if there is a storage with linked models.
         The directory (dms.directory) linked to the record (if it does not exist)
         and the file (dms.file) with the linked attachment would be created.
+
+        The attachments are processed by batch: the directories and the files of
+        all the records of a model are searched and created at once.
         """
-        for attachment in self:
-            if (
-                not attachment.res_model
-                or not attachment.res_id
-                or (
-                    attachment.res_model
-                    and not self._dms_operations_from_model(attachment.res_model)
-                )
-            ):
-                continue
-            directories = attachment._get_dms_directories(
-                attachment.res_model, attachment.res_id
+        attachments = self.filtered(
+            lambda attachment: attachment.res_model
+            and attachment.res_id
+            and self._dms_operations_from_model(attachment.res_model)
+        )
+        dms_file_model = self.env["dms.file"].sudo()
+        for res_model, model_attachments in attachments.grouped("res_model").items():
+            res_ids = list(set(model_attachments.mapped("res_id")))
+            directories = self._get_dms_directories(res_model, res_ids)
+            linked_ids = set(directories.mapped("res_id"))
+            missing = model_attachments.filtered(
+                lambda attachment: attachment.res_id not in linked_ids
             )
-            if not directories:
-                attachment._dms_directories_create()
+            if missing:
+                missing._dms_directories_create()
                 # Get dms_directories again (with items previously created)
-                directories = attachment._get_dms_directories(
-                    attachment.res_model, attachment.res_id
-                )
+                directories = self._get_dms_directories(res_model, res_ids)
             # Auto-create_files (if not exists)
-            for directory in directories:
-                dms_file_model = self.env["dms.file"].sudo()
-                dms_file = dms_file_model.search(
+            existing = {
+                (dms_file.attachment_id.id, dms_file.directory_id.id)
+                for dms_file in dms_file_model.search(
                     [
-                        ("attachment_id", "=", attachment.id),
-                        ("directory_id", "=", directory.id),
+                        ("attachment_id", "in", model_attachments.ids),
+                        ("directory_id", "in", directories.ids),
                     ]
                 )
-                if not dms_file:
-                    dms_file_model.create(
-                        {
-                            "name": attachment.name,
-                            "directory_id": directory.id,
-                            "attachment_id": attachment.id,
-                            "res_model": attachment.res_model,
-                            "res_id": attachment.res_id,
-                        }
-                    )
+            }
+            directories_by_record = directories.grouped("res_id")
+            vals_list = [
+                {
+                    "name": attachment.name,
+                    "directory_id": directory.id,
+                    "attachment_id": attachment.id,
+                    "res_model": attachment.res_model,
+                    "res_id": attachment.res_id,
+                }
+                for attachment in model_attachments
+                for directory in directories_by_record.get(
+                    attachment.res_id, directories.browse()
+                )
+                if (attachment.id, directory.id) not in existing
+            ]
+            if vals_list:
+                dms_file_model.create(vals_list)
+
+    def _dms_sync(self):
+        """Mirror the attachments in the documents, or enqueue them to be
+        mirrored later when the synchronization is deferred."""
+        queue = self.env["dms.attachment.queue"]
+        if not queue._is_enabled():
+            self._dms_operations()
+            return
+        attachments = self.filtered(
+            lambda attachment: attachment.res_model
+            and attachment.res_id
+            and self._dms_operations_from_model(attachment.res_model)
+        )
+        queue._enqueue(attachments)
 
     @api.model_create_multi
     def create(self, vals_list):
         records = super().create(vals_list)
         if not self.env.context.get("dms_file"):
-            records._dms_operations()
+            records._dms_sync()
         return records
 
     def write(self, vals):
@@ -97,7 +161,7 @@ class IrAttachment(models.Model):
         if not self.env.context.get("dms_file") and self.env.context.get(
             "attaching_to_record"
         ):
-            self._dms_operations()
+            self._dms_sync()
         return res
 
     def unlink(self):
@@ -5,8 +5,10 @@
 
 import os
 
-from odoo import api, fields, models
-from odoo.tools.misc import file_path
+from odoo import api, fields, models, tools
+from odoo.tools.misc import file_path, frozendict
+
+ICONS_PATH = "dms/static/icons"
 
 
 class Thumbnail(models.AbstractModel):
@@ -18,24 +20,33 @@ class Thumbnail(models.AbstractModel):
 
     def _get_icon_disk_path(self):
         """Get the local disk path to record icon."""
-        name = self._get_icon_placeholder_name()
-        folders = ["dms", "static", "icons"]
-
-        try:
-            path = file_path(os.path.join(*folders, name))
-        except FileNotFoundError:
-            return file_path(os.path.join(*folders, "file_unknown.svg"))
-
-        return path or file_path(os.path.join(*folders, "file_unknown.svg"))
+        paths = self._get_icon_paths()
+        return paths.get(self._get_icon_placeholder_name()) or paths["file_unknown.svg"]
 
     def _get_icon_placeholder_name(self):
         return "folder.svg"
 
+    @api.model
+    @tools.ormcache()
+    def _get_icon_paths(self):
+        """
+        Get the local disk paths of the shipped icons, listed once per registry
+        rather than looked up in the addons paths for each record.
+
+        :return: The paths of the icons by icon name.
+        :rtype: dict[str, str]
+        """
+        folder = file_path(ICONS_PATH)
+        return frozendict(
+            (name, os.path.join(folder, name))
+            for name in os.listdir(folder)
+            if name.endswith(".svg")
+        )
+
     def _get_icon_url(self):
         """Obtain URL to record icon."""
-        local_path = self._get_icon_disk_path()
-        icon_name = os.path.basename(local_path)
-        return f"/dms/static/icons/{icon_name}"
+        icon_name = os.path.basename(self._get_icon_disk_path())
+        return f"/{ICONS_PATH}/{icon_name}"
 
     @api.depends("image_128")
     def _compute_icon_url(self):
@@ -2,7 +2,7 @@
 # Copyright 2017-2019 MuK IT GmbH
 # License LGPL-3.0 or later (http://www.gnu.org/licenses/lgpl).
 
-from odoo import fields, models
+from odoo import _, fields, models
 
 
 class ResConfigSettings(models.TransientModel):
@@ -19,3 +19,68 @@ class ResConfigSettings(models.TransientModel):
         help="Defines a list of forbidden file extensions. (Example: 'exe,msi')",
         config_parameter="dms.forbidden_extensions",
     )
+
+    documents_use_directory_rollup = fields.Boolean(
+        string="Maintained Directory Totals",
+        help="Read the size and the total numbers of files and subdirectories of "
+        "the directories from maintained totals instead of aggregating them over "
+        "their subtree. The totals then include the records the user can not "
+        "access.",
+        config_parameter="dms.use_directory_rollup",
+    )
+
+    documents_attachment_sync_mode = fields.Selection(
+        selection=[("sync", "Immediate"), ("deferred", "Deferred")],
+        string="Attachments Synchronization",
+        default="sync",
+        help="Mirror the attachments of the records in the documents when they "
+        "are created, or enqueue them to be mirrored by a scheduled action.",
+        config_parameter="dms.attachment_sync_mode",
+    )
+    documents_attachment_queue_count = fields.Integer(
+        string="Waiting Attachments", compute="_compute_attachment_queue"
+    )
+    documents_attachment_queue_failed = fields.Integer(
+        string="Failed Attachments", compute="_compute_attachment_queue"
+    )
+
+    def _compute_attachment_queue(self):
+        waiting, failed, __ = self.env["dms.attachment.queue"].sudo()._get_backlog()
+        for record in self:
+            record.documents_attachment_queue_count = waiting
+            record.documents_attachment_queue_failed = failed
+
+    def set_values(self):
+        rollup = self.env["dms.directory.rollup"]
+        enabled = rollup._is_enabled()
+        res = super().set_values()
+        if not enabled and rollup._is_enabled():
+            rollup._rebuild()
+        return res
+
+    def action_dms_rebuild_directory_rollup(self):
+        self.env["dms.directory.rollup"].sudo()._rebuild()
+
+    def action_dms_check_directory_rollup(self):
+        rollup = self.env["dms.directory.rollup"].sudo()
+        directories = rollup._check_consistency()
+        if directories:
+            rollup._rebuild()
+            message = _(
+                "The totals of %s directories were out of date and have been "
+                "rebuilt.",
+                len(directories),
+            )
+        else:
+            message = _("The totals of the directories are up to date.")
+        return {
+            "type": "ir.actions.client",
+            "tag": "display_notification",
+            "params": {
+                "type": "warning" if directories else "success",
+                "message": message,
+            },
+        }
+
+    def action_dms_process_attachment_queue(self):
+        self.env["dms.attachment.queue"].sudo()._process()
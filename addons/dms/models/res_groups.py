@@ -0,0 +1,24 @@
+# Copyright 2024 Subteno - Timothée Vannier (https://www.subteno.com).
+# License LGPL-3.0 or later (http://www.gnu.org/licenses/lgpl).
+
+from odoo import models
+
+
+class ResGroups(models.Model):
+    _inherit = "res.groups"
+
+    def write(self, vals):
+        if "users" not in vals and "implied_ids" not in vals:
+            return super().write(vals)
+        users = self.users
+        res = super().write(vals)
+        # Users added to implied groups are users of these groups too
+        self.env["dms.access.group"]._update_users(users=users | self.users)
+        return res
+
+    def unlink(self):
+        users = self.users
+        res = super().unlink()
+        # Deleting the groups deletes their memberships of the access groups
+        self.env["dms.access.group"]._update_users(users=users)
+        return res
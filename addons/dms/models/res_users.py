@@ -0,0 +1,23 @@
+# Copyright 2024 Subteno - Timothée Vannier (https://www.subteno.com).
+# License LGPL-3.0 or later (http://www.gnu.org/licenses/lgpl).
+
+from odoo import api, models
+
+
+class ResUsers(models.Model):
+    _inherit = "res.users"
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        users = super().create(vals_list)
+        self.env["dms.access.group"]._update_users(users=users)
+        return users
+
+    def write(self, vals):
+        # The groups set from the user form are only converted to groups_id by
+        # the override of the base module, running after this one
+        vals = self._remove_reified_groups(vals)
+        res = super().write(vals)
+        if "groups_id" in vals:
+            self.env["dms.access.group"]._update_users(users=self)
+        return res
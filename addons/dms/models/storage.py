@@ -85,6 +85,13 @@ class Storage(models.Model):
         "composition process too",
     )
     model = fields.Char(search="_search_model", store=False)
+    deduplicate_content = fields.Boolean(
+        string="Deduplicate Content",
+        default=False,
+        help="Indicate if files with the same content share a single copy of it "
+        "instead of storing their own. Applies to new content only; existing files "
+        "are deduplicated when their content is migrated or updated.",
+    )
 
     def _search_model(self, operator, value):
         allowed_items = self.env["ir.model"].sudo().search([("model", operator, value)])
@@ -98,17 +105,18 @@ class Storage(models.Model):
 
     # Actions
     def action_storage_migrate(self):
-        if self.save_type != "attachment":
-            if not self.env.user.has_group("dms.group_dms_manager"):
-                raise AccessError(_("Only managers can execute this action."))
-            files = self.env["dms.file"].with_context(active_test=False).sudo()
-
-            for record in self:
-                domain = [
-                    ("require_migration", "=", True),
-                    ("storage_id", "=", record.id),
-                ]
-                files.search(domain).action_migrate()
+        """Start the migration of the files by batches, in the background."""
+        storages = self.filtered(lambda storage: storage.save_type != "attachment")
+        if not storages:
+            return
+        if not self.env.user.has_group("dms.group_dms_manager"):
+            raise AccessError(_("Only managers can execute this action."))
+        migrations = self.env["dms.storage.migration"].sudo()._start(storages)
+        action = self.env["ir.actions.act_window"]._for_xml_id(
+            "dms.action_dms_storage_migration"
+        )
+        action["domain"] = [("id", "in", migrations.ids)]
+        return action
 
     def action_save_onboarding_storage_step(self):
         self.env.user.company_id.set_onboarding_step_done(
@@ -128,6 +136,10 @@ class Storage(models.Model):
 
     def write(self, values):
         res = super().write(values)
-        if "model_ids" in values:
+        access_keys = ["save_type", "inherit_access_from_parent_record"]
+        if any(key in values for key in ["model_ids", "is_hidden", *access_keys]):
+            # The root directories of the users are cached
             self.env.registry.clear_cache()
+        if any(key in values for key in access_keys):
+            self.env["dms.directory"]._invalidate_inherited_access_models()
         return res
@@ -0,0 +1,318 @@
+# Copyright 2024 Subteno - Timothée Vannier (https://www.subteno.com).
+# License LGPL-3.0 or later (http://www.gnu.org/licenses/lgpl).
+
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from odoo import SUPERUSER_ID, _, api, fields, models
+from odoo.modules import module
+from odoo.tools import SQL
+
+_logger = logging.getLogger(__name__)
+
+
+class DmsStorageMigration(models.Model):
+    """Migration of the files of a storage to its save type.
+
+    The files requiring a migration are processed by batches, each batch being
+    committed on its own: a migrated file no longer requires a migration, so an
+    interrupted migration resumes where it stopped. Several workers, each with
+    its own cursor, can process the batches in parallel, the files of a batch
+    being locked by the worker processing it.
+    """
+
+    _name = "dms.storage.migration"
+    _description = "Storage Migration"
+    _order = "id desc"
+
+    storage_id = fields.Many2one(
+        comodel_name="dms.storage",
+        required=True,
+        readonly=True,
+        ondelete="cascade",
+    )
+    state = fields.Selection(
+        selection=[
+            ("pending", "Pending"),
+            ("running", "Running"),
+            ("done", "Done"),
+            ("cancelled", "Cancelled"),
+        ],
+        default="pending",
+        required=True,
+        readonly=True,
+    )
+    workers = fields.Integer(
+        default=lambda self: self._default_workers(),
+        help="Number of files batches migrated in parallel.",
+    )
+    batch_size = fields.Integer(
+        default=50, help="Number of files migrated and committed at once."
+    )
+    file_count = fields.Integer(string="Files", readonly=True)
+    done_count = fields.Integer(string="Migrated Files", readonly=True)
+    done_size = fields.Float(string="Migrated Size", readonly=True)
+    failed_file_ids = fields.Many2many(
+        comodel_name="dms.file",
+        relation="dms_storage_migration_failed_rel",
+        column1="migration_id",
+        column2="file_id",
+        string="Failed Files",
+        context={"active_test": False},
+        readonly=True,
+    )
+    start_date = fields.Datetime(readonly=True)
+    end_date = fields.Datetime(readonly=True)
+    progress = fields.Float(compute="_compute_progress")
+    throughput = fields.Float(
+        string="Throughput (MB/s)", compute="_compute_progress", digits=(16, 2)
+    )
+
+    @api.model
+    def _default_workers(self):
+        get_param = self.env["ir.config_parameter"].sudo().get_param
+        return int(get_param("dms.migration_workers", default=1))
+
+    @api.depends("file_count", "done_count", "done_size", "start_date", "end_date")
+    def _compute_progress(self):
+        now = fields.Datetime.now()
+        for record in self:
+            processed = record.done_count + len(record.failed_file_ids)
+            record.progress = (
+                100.0 * processed / record.file_count if record.file_count else 0.0
+            )
+            duration = (
+                ((record.end_date or now) - record.start_date).total_seconds()
+                if record.start_date
+                else 0
+            )
+            record.throughput = (
+                record.done_size / duration / 1024 / 1024 if duration > 0 else 0.0
+            )
+
+    def action_cancel(self):
+        self.filtered(lambda m: m.state in ("pending", "running")).write(
+            {"state": "cancelled", "end_date": fields.Datetime.now()}
+        )
+
+    @api.model
+    def _cron_run(self, time_budget=600):
+        """
+        Run the pending migrations, until the time budget is spent: the
+        scheduled action is then triggered again to resume them, before the
+        worker running it reaches its time limit.
+
+        :param int time_budget: The duration after which no batch is started, in
+        seconds.
+        """
+        deadline = time.monotonic() + time_budget
+        # Running migrations were interrupted, as the scheduled action is the
+        # only one running them
+        for migration in self.search([("state", "in", ("pending", "running"))]):
+            if not migration._run(deadline):
+                self.env.ref("dms.ir_cron_dms_storage_migration").sudo()._trigger()
+                return
+
+    def _run(self, deadline=None):
+        """
+        Migrate the files of the storage, by batches and in parallel.
+
+        :param float deadline: The time after which no batch is started, as
+        given by ``time.monotonic()``.
+
+        :return: Whether the migration is over.
+        :rtype: bool
+        """
+        self.ensure_one()
+        # Batches are not committed while testing, as the other cursors could
+        # not see the files of the test transaction
+        commit = not module.current_test
+        files = self.env["dms.file"].with_context(active_test=False)
+        self.write(
+            {
+                "state": "running",
+                "start_date": self.start_date or fields.Datetime.now(),
+                "file_count": self.done_count
+                + len(self.failed_file_ids)
+                + files.search_count(self._get_files_domain()),
+            }
+        )
+        if commit:
+            self.env.cr.commit()
+        if commit and self.workers > 1:
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                futures = [
+                    executor.submit(
+                        self._run_worker, self.env.registry, self.id, deadline
+                    )
+                    for __ in range(self.workers)
+                ]
+                over = all([future.result() for future in futures])
+            self.invalidate_recordset()
+        else:
+            over = self._migrate_batches(commit, deadline)
+        if not over:
+            return False
+        if self.state == "running":
+            self.write({"state": "done", "end_date": fields.Datetime.now()})
+        _logger.info(
+            "Migrated %s files of the storage %s (%s failed, %.2f MB/s)",
+            self.done_count,
+            self.storage_id.display_name,
+            len(self.failed_file_ids),
+            self.throughput,
+        )
+        return True
+
+    @api.model
+    def _run_worker(self, registry, migration_id, deadline):
+        with registry.cursor() as cr:
+            env = api.Environment(cr, SUPERUSER_ID, {})
+            migration = env[self._name].browse(migration_id)
+            return migration._migrate_batches(commit=True, deadline=deadline)
+
+    def _get_files_domain(self):
+        return [
+            ("storage_id", "=", self.storage_id.id),
+            ("require_migration", "=", True),
+            ("id", "not in", self.failed_file_ids.ids),
+        ]
+
+    def _claim_batch(self):
+        """Lock and return the next files to migrate. Files locked by another
+        worker are skipped."""
+        files = self.env["dms.file"].with_context(active_test=False)
+        files.flush_model(["storage_id", "require_migration"])
+        self.flush_recordset(["failed_file_ids"])
+        rows = self.env.execute_query(
+            SQL(
+                """
+                SELECT file.id FROM dms_file AS file
+                WHERE file.storage_id = %s
+                    AND file.require_migration
+                    AND NOT EXISTS (
+                        SELECT 1 FROM dms_storage_migration_failed_rel AS failed
+                        WHERE failed.migration_id = %s AND failed.file_id = file.id
+                    )
+                ORDER BY file.id
+                LIMIT %s
+                FOR UPDATE OF file SKIP LOCKED
+                """,
+                self.storage_id.id,
+                self.id,
+                max(self.batch_size, 1),
+            )
+        )
+        return files.browse(row[0] for row in rows)
+
+    def _migrate_batches(self, commit, deadline=None):
+        """
+        Migrate batches of files until none is left, or until the deadline.
+
+        :param bool commit: Whether each batch is committed, or only isolated in
+        a savepoint.
+        :param float deadline: The time after which no batch is started, as
+        given by ``time.monotonic()``.
+
+        :return: Whether no batch is left to migrate.
+        :rtype: bool
+        """
+        while True:
+            self.invalidate_recordset(["state"])
+            if self.state != "running":
+                return True
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            files = self._claim_batch()
+            if not files:
+                return True
+            start = time.monotonic()
+            failed = files.browse()
+            try:
+                with self.env.cr.savepoint():
+                    size = files._migrate_contents()
+            except Exception:
+                # Migrate the files one by one to isolate the failing ones
+                size = 0
+                for dms_file in files:
+                    try:
+                        with self.env.cr.savepoint():
+                            size += dms_file._migrate_contents()
+                    except Exception:
+                        _logger.exception(
+                            "Failed to migrate the file %s", dms_file.id
+                        )
+                        failed |= dms_file
+            # Files still requiring a migration would be claimed again forever
+            unchanged = files.filtered("require_migration") - failed
+            if unchanged:
+                _logger.warning(
+                    "Failed to migrate the files %s: their content did not move",
+                    unchanged.ids,
+                )
+                failed |= unchanged
+            self.env.cr.execute(
+                SQL(
+                    """
+                    UPDATE dms_storage_migration
+                    SET done_count = done_count + %s, done_size = done_size + %s
+                    WHERE id = %s
+                    """,
+                    len(files) - len(failed),
+                    size,
+                    self.id,
+                )
+            )
+            if failed:
+                self.env.cr.execute(
+                    SQL(
+                        """
+                        INSERT INTO dms_storage_migration_failed_rel
+                            (migration_id, file_id)
+                        SELECT %s, id FROM unnest(%s::integer[]) AS id
+                        ON CONFLICT DO NOTHING
+                        """,
+                        self.id,
+                        failed.ids,
+                    )
+                )
+            self.invalidate_recordset()
+            _logger.info(
+                "Migrated %s files of the storage %s in %.2fs",
+                len(files) - len(failed),
+                self.storage_id.display_name,
+                time.monotonic() - start,
+            )
+            if commit:
+                self.env.cr.commit()
+
+    @api.model
+    def _start(self, storages):
+        """
+        Start the migration of the files of the storages, unless one is already
+        running.
+
+        :param odoo.model.dms_storage storages: The storages.
+
+        :return: The migrations of the storages.
+        :rtype: odoo.model.dms_storage_migration
+        """
+        running = self.search(
+            [
+                ("storage_id", "in", storages.ids),
+                ("state", "in", ("pending", "running")),
+            ]
+        )
+        new_storages = storages - running.storage_id
+        migrations = running | self.create(
+            [{"storage_id": storage.id} for storage in new_storages]
+        )
+        self.env.ref("dms.ir_cron_dms_storage_migration").sudo()._trigger()
+        return migrations
+
+    def _compute_display_name(self):
+        for record in self:
+            record.display_name = _(
+                "Migration of %(storage)s", storage=record.storage_id.display_name
+            )
@@ -0,0 +1,53 @@
+// /** ********************************************************************************
+//     Copyright 2024 Subteno - Timothée Vannier (https://www.subteno.com).
+//     License LGPL-3.0 or later (http://www.gnu.org/licenses/lgpl).
+//  **********************************************************************************/
+
+import publicWidget from "@web/legacy/js/public/public_widget";
+import {rpc} from "@web/core/network/rpc";
+
+publicWidget.registry.DmsPortalLoadMore = publicWidget.Widget.extend({
+    selector: ".o_dms_portal",
+    events: {
+        "click .o_dms_load_more": "_onClickLoadMore",
+    },
+
+    /**
+     * Append the rows of the next page to the table, instead of reloading the
+     * whole page.
+     *
+     * @private
+     * @param {MouseEvent} ev
+     */
+    async _onClickLoadMore(ev) {
+        ev.preventDefault();
+        const button = ev.currentTarget;
+        if (button.classList.contains("disabled")) {
+            return;
+        }
+        button.classList.add("disabled");
+        const data = button.dataset;
+        const result = await rpc("/my/dms/load_more", {
+            after: data.after,
+            dms_directory_id: data.directoryId ? parseInt(data.directoryId) : null,
+            access_token: data.accessToken || null,
+            search: data.search || null,
+            search_in: data.searchIn || null,
+            sortby: data.sortby || null,
+        });
+        this.el
+            .querySelector(".o_dms_portal_rows")
+            .insertAdjacentHTML("beforeend", result.html);
+        if (result.next_cursor) {
+            data.after = result.next_cursor;
+            const url = new URL(button.href);
+            url.searchParams.set("after", result.next_cursor);
+            button.href = url.toString();
+            button.classList.remove("disabled");
+        } else {
+            button.parentElement.remove();
+        }
+    },
+});
+
+export default publicWidget.registry.DmsPortalLoadMore;
@@ -5,9 +5,10 @@
 # License LGPL-3.0 or later (http://www.gnu.org/licenses/lgpl).
 
 import os
+from unittest.mock import patch
 
 from odoo import Command
-from odoo.exceptions import AccessError, UserError
+from odoo.exceptions import AccessError, UserError, ValidationError
 from odoo.tests import new_test_user
 from odoo.tests.common import users
 from odoo.tools import mute_logger
@@ -96,6 +97,22 @@ class DirectoryTestCaseBase(StorageDatabaseBaseCase):
             msg="The path name of the subdirectory should have changed",
         )
 
+    @users("dms-manager", "dms-user")
+    def test_duplicated_name(self):
+        sub_directory = self.create_directory(directory=self.directory)
+        with self.assertRaises(ValidationError):
+            self.create_directory(directory=self.directory).name = sub_directory.name
+        with self.assertRaises(ValidationError):
+            self.directory_model.create(
+                {
+                    "name": self.directory.name,
+                    "is_root_directory": True,
+                    "storage_id": self.storage.id,
+                }
+            )
+        # Same name in another directory
+        self.create_directory(directory=sub_directory).name = sub_directory.name
+
     @users("dms-manager", "dms-user")
     def test_move_directory(self):
         with self.assertRaises(UserError, msg="The root directory should not be moved"):
@@ -240,6 +257,62 @@ class DirectoryTestCaseBase(StorageDatabaseBaseCase):
     def test_size(self):
         self.assertTrue(self.directory.size, msg="The directory should have a size")
 
+    @users("dms-manager", "dms-user")
+    def test_totals(self):
+        sub_directory = self.create_directory(directory=self.subdirectory)
+        self.create_file(directory=sub_directory)
+        self.create_file(directory=sub_directory).active = False
+        directories = self.directory | self.subdirectory | sub_directory
+        directories.invalidate_recordset()
+        for directory in directories:
+            files = self.env["dms.file"].search(
+                [("directory_id", "child_of", directory.id)]
+            )
+            self.assertEqual(directory.count_total_files, len(files))
+            self.assertEqual(directory.size, sum(files.sudo().mapped("size")))
+            self.assertEqual(
+                directory.count_total_directories,
+                self.env["dms.directory"].search_count(
+                    [("id", "child_of", directory.id)]
+                )
+                - 1,
+            )
+
+    def test_directory_rollup(self):
+        rollup = self.env["dms.directory.rollup"]
+        self.env["ir.config_parameter"].sudo().set_param(
+            "dms.use_directory_rollup", True
+        )
+        rollup._rebuild()
+        sub_directory = self.create_directory(directory=self.subdirectory)
+        other_directory = self.create_directory(directory=self.directory)
+        files = self.create_file(directory=sub_directory) | self.create_file(
+            directory=other_directory
+        )
+        self.file_model.create(
+            {"name": "raw.txt", "directory_id": sub_directory.id, "content_raw": b"raw"}
+        )
+        # Files created with their content are only counted once
+        self.assertFalse(rollup._check_consistency())
+        files[0].content = self.content_base64() * 2
+        files[1].directory_id = sub_directory
+        sub_directory.parent_id = other_directory
+        self.create_file(directory=other_directory).unlink()
+        self.create_file(directory=self.directory).active = False
+        self.assertFalse(rollup._check_consistency())
+        directories = self.directory | other_directory | sub_directory
+        self.assertEqual(
+            rollup._read_totals(directories.ids), directories._get_totals()
+        )
+        self.assertEqual(other_directory.size, sum(files.mapped("size")))
+        sub_directory.unlink()
+        self.assertFalse(rollup._check_consistency())
+        # Totals out of date are rebuilt by the scheduled check
+        rollup.search([("directory_id", "=", self.directory.id)]).unlink()
+        self.assertEqual(rollup._check_consistency(), self.directory)
+        rollup._cron_check_consistency()
+        self.assertFalse(rollup._check_consistency())
+
     @users("dms-manager", "dms-user")
     def test_name_get(self):
         directory = self.subdirectory.with_context(dms_directory_show_path=True)
@@ -268,6 +341,64 @@ class DirectoryTestCaseBase(StorageDatabaseBaseCase):
             msg="The tag_ids field should be a multi range field",
         )
 
+    def test_check_access_token(self):
+        other_directory = self.create_directory(storage=self.storage)
+        sub_directory = self.create_directory(directory=self.subdirectory)
+        dms_file = self.create_file(directory=sub_directory)
+        other_file = self.create_file(directory=other_directory)
+        access_token = self.subdirectory._portal_ensure_token()
+        self.assertTrue(self.subdirectory.check_access_token(access_token))
+        self.assertTrue(sub_directory.check_access_token(access_token))
+        self.assertTrue(dms_file.check_access_token(access_token))
+        self.assertFalse(self.directory.check_access_token(access_token))
+        self.assertFalse(other_directory.check_access_token(access_token))
+        self.assertFalse(other_file.check_access_token(access_token))
+        self.assertFalse(sub_directory.check_access_token("invalid"))
+        # Moving the directory out of the shared subtree revokes the access
+        sub_directory.parent_id = other_directory
+        self.assertFalse(dms_file.check_access_token(access_token))
+
+    @users("dms-manager", "dms-user")
+    def test_own_root_directories(self):
+        directory_model = self.env["dms.directory"]
+        root_ids = directory_model._get_own_root_directories()
+        visible = directory_model.search([("is_hidden", "=", False)])
+        expected = visible.filtered(lambda d: d.parent_id not in visible)
+        self.assertEqual(set(root_ids), set(expected.ids))
+        self.assertIn(self.directory.id, root_ids)
+        self.assertNotIn(self.subdirectory.id, root_ids)
+        # The cached roots are cleared when directories are created or deleted
+        new_directory = self.create_directory(storage=self.storage)
+        self.assertIn(new_directory.id, directory_model._get_own_root_directories())
+        new_directory.unlink()
+        self.assertNotIn(
+            new_directory.id, directory_model._get_own_root_directories()
+        )
+
+    def test_complete_groups(self):
+        group = self.access_group_model.create({"name": "Test complete groups"})
+        root_directory = self.create_directory(storage=self.storage)
+        middle_directory = self.create_directory(directory=root_directory)
+        leaf_directory = self.create_directory(directory=middle_directory)
+        other_directory = self.create_directory(storage=self.storage)
+        root_groups = root_directory.complete_group_ids
+        root_directory.group_ids = [Command.link(group.id)]
+        for directory in root_directory | middle_directory | leaf_directory:
+            self.assertIn(group, directory.complete_group_ids)
+        middle_directory.write(
+            {"inherit_group_ids": False, "group_ids": [Command.set(root_groups.ids)]}
+        )
+        self.assertNotIn(group, middle_directory.complete_group_ids)
+        self.assertEqual(leaf_directory.complete_group_ids, root_groups)
+        leaf_directory.parent_id = root_directory
+        self.assertIn(group, leaf_directory.complete_group_ids)
+        leaf_directory.parent_id = other_directory
+        self.assertEqual(
+            leaf_directory.complete_group_ids, other_directory.complete_group_ids
+        )
+        self.assertIn(root_directory, group.complete_directory_ids)
+        self.assertNotIn(leaf_directory, group.complete_directory_ids)
+
     def test_directory_unlink_custom(self):
         user = new_test_user(
             self.env, login="test-dms-customer-user", groups="dms.group_dms_user"
@@ -280,6 +411,30 @@ class DirectoryTestCaseBase(StorageDatabaseBaseCase):
         with self.assertRaises(AccessError):
             root_directory.with_user(user).unlink()
 
+    def test_access_groups_cache(self):
+        user = new_test_user(
+            self.env, login="test-dms-cache-user", groups="dms.group_dms_user"
+        )
+        group = self.access_group_model.create(
+            {"name": "Test cache group", "explicit_user_ids": [Command.set(user.ids)]}
+        )
+        root_directory = self.create_directory(storage=self.storage)
+        root_directory.group_ids = [Command.link(group.id)]
+        directory_model = self.env["dms.directory"].with_user(user)
+        self.assertNotIn(
+            root_directory.id, directory_model._get_access_directory_ids("write")
+        )
+        registry = type(self.env.registry)
+        # Renaming the group keeps the cached directories
+        with patch.object(registry, "clear_cache") as clear_cache:
+            group.name = "Test cache group renamed"
+        clear_cache.assert_not_called()
+        # Granting a permission clears them
+        group.perm_write = True
+        self.assertIn(
+            root_directory.id, directory_model._get_access_directory_ids("write")
+        )
+
 
 class DirectoryMailTestCase(StorageDatabaseBaseCase):
     @classmethod
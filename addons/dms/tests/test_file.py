@@ -4,6 +4,8 @@
 # License LGPL-3.0 or later (http://www.gnu.org/licenses/lgpl).
 
 import base64
+import hashlib
+import io
 
 from odoo.exceptions import UserError
 from odoo.tests import new_test_user
@@ -105,6 +107,95 @@ class FileFilestoreTestCase(StorageFileBaseCase):
             msg="User A should see sub_directory_x",
         )
 
+    def test_file_access_cache(self):
+        dms_file_model = self.file_model.with_user(self.user_a)
+        domain = [("id", "=", self.inaccessible_file.id)]
+        self.assertFalse(dms_file_model.search(domain))
+        group = self.access_group_model.create(
+            {"name": "Group Cache", "explicit_user_ids": [(6, 0, [self.user_a.id])]}
+        )
+        self.inaccessible_directory.group_ids = [(4, group.id)]
+        self.assertTrue(dms_file_model.search(domain))
+        group.explicit_user_ids = [(5, 0, 0)]
+        self.assertFalse(dms_file_model.search(domain))
+
+    def test_access_group_users(self):
+        res_group = self.env["res.groups"].create({"name": "DMS Test Group"})
+        child_group = self.access_group_model.create(
+            {
+                "name": "Child Group A",
+                "parent_group_id": self.group_a.id,
+                "explicit_user_ids": [(6, 0, [])],
+            }
+        )
+        self.assertEqual(child_group.users, self.group_a.users)
+        self.group_a.group_ids = [(4, res_group.id)]
+        user_b = new_test_user(self.env, login="user-b", groups="dms.group_dms_user")
+        self.assertNotIn(user_b, child_group.users)
+        res_group.users = [(4, user_b.id)]
+        self.assertIn(user_b, self.group_a.users)
+        self.assertIn(user_b, child_group.users)
+        self.assertEqual(child_group.count_users, len(child_group.users))
+        user_b.groups_id = [(3, res_group.id)]
+        self.assertNotIn(user_b, child_group.users)
+        child_group.parent_group_id = False
+        self.assertFalse(child_group.users)
+
+    def test_access_group_revoke_unlink(self):
+        dms_file_model = self.file_model.with_user(self.user_a)
+        domain = [("id", "=", self.inaccessible_file.id)]
+        res_group = self.env["res.groups"].create(
+            {"name": "DMS Test Group", "users": [(4, self.user_a.id)]}
+        )
+        group = self.access_group_model.create(
+            {"name": "Group Res Groups", "group_ids": [(6, 0, res_group.ids)]}
+        )
+        self.inaccessible_directory.group_ids = [(4, group.id)]
+        self.assertTrue(dms_file_model.search(domain))
+        res_group.unlink()
+        self.assertNotIn(self.user_a, group.users)
+        self.assertFalse(dms_file_model.search(domain))
+        parent_group = self.access_group_model.create(
+            {"name": "Parent Group", "explicit_user_ids": [(6, 0, self.user_a.ids)]}
+        )
+        child_group = self.access_group_model.create(
+            {
+                "name": "Child Group",
+                "parent_group_id": parent_group.id,
+                "explicit_user_ids": [(6, 0, [])],
+            }
+        )
+        self.inaccessible_directory.group_ids = [(4, child_group.id)]
+        self.assertTrue(dms_file_model.search(domain))
+        parent_group.unlink()
+        self.assertFalse(child_group.exists())
+        self.assertFalse(dms_file_model.search(domain))
+
+    def test_access_group_user_form(self):
+        res_group = self.env["res.groups"].create({"name": "DMS Test Group"})
+        group = self.access_group_model.create(
+            {"name": "Group Res Groups", "group_ids": [(6, 0, res_group.ids)]}
+        )
+        self.user_a.write({f"in_group_{res_group.id}": True})
+        self.assertIn(self.user_a, group.users)
+        self.user_a.write({f"in_group_{res_group.id}": False})
+        self.assertNotIn(self.user_a, group.users)
+
+    @users("user-a")
+    def test_file_permissions(self):
+        dms_files = (self.file | self.file2 | self.inaccessible_file).with_user(
+            self.env.user
+        )
+        for operation in ("create", "read", "unlink", "write"):
+            with self.subTest(operation=operation):
+                expected = [
+                    bool(dms_file._filtered_access(operation)) for dms_file in dms_files
+                ]
+                self.assertEqual(
+                    dms_files.mapped(f"permission_{operation}"), expected
+                )
+        self.assertEqual(dms_files.mapped("permission_read"), [False, True, False])
+
     @users("dms-manager", "dms-user")
     @mute_logger("odoo.models.unlink")
     def test_content_file(self):
@@ -144,6 +235,27 @@ class FileFilestoreTestCase(StorageFileBaseCase):
         self.assertTrue(object_file.export_data(["content"]))
         object_file.unlink()
 
+    @users("dms-manager", "dms-user")
+    def test_content_raw(self):
+        raw = b"Lorem ipsum dolor sit amet"
+        for index, source in enumerate((raw, io.BytesIO(raw))):
+            dms_file = self.file_model.create(
+                {
+                    "name": f"lorem-{index}.txt",
+                    "directory_id": self.directory.id,
+                    "content_raw": source,
+                }
+            )
+            self.assertEqual(dms_file.content, base64.b64encode(raw))
+            self.assertEqual(dms_file.checksum, hashlib.sha1(raw).hexdigest())
+            self.assertEqual(dms_file.size, len(raw))
+            self.assertEqual(dms_file.mimetype, "text/plain")
+            self.assertEqual(dms_file.extension, "txt")
+            self.assertEqual(dms_file.save_type, "file")
+        dms_file.write({"content_raw": b"\xff new content"})
+        self.assertEqual(dms_file.content, base64.b64encode(b"\xff new content"))
+        self.assertEqual(dms_file.size, len(b"\xff new content"))
+
     def test_content_file_mimetype(self):
         file_svg = self.env.ref("dms.file_05_demo")
         self.assertEqual(file_svg.mimetype, "image/svg+xml", msg="SVG mimetype")
@@ -3,10 +3,20 @@
 # Copyright 2021-2022 Tecnativa - Víctor Martínez
 # License LGPL-3.0 or later (http://www.gnu.org/licenses/lgpl).
 
-from odoo.exceptions import UserError
+import base64
+import io
+import json
+import os
+from unittest.mock import patch
+
+from PIL import Image
+
+from odoo.exceptions import UserError, ValidationError
 from odoo.tests.common import users
 from odoo.tools import mute_logger
+from odoo.tools.misc import file_path
 
+from ..tools import preview, thumbnail
 from .common import StorageDatabaseBaseCase
 
 
@@ -55,6 +65,17 @@ class FileDatabaseTestCase(StorageDatabaseBaseCase):
         file.write({"name": f"test-{self.env.user.login}.jpg"})
         self.assertNotEqual(file.extension, extension, "Extension should be different")
 
+    @users("dms-manager", "dms-user")
+    def test_duplicated_name(self):
+        file = self.create_file(directory=self.directory)
+        with self.assertRaises(ValidationError):
+            self.create_file(directory=self.directory).name = file.name
+        # An archived file does not reserve its name
+        file.active = False
+        self.create_file(directory=self.directory).name = file.name
+        with self.assertRaises(ValidationError):
+            file.active = True
+
     @users("dms-manager", "dms-user")
     def test_move_file(self):
         file = self.create_file(directory=self.directory)
@@ -86,8 +107,124 @@ class FileDatabaseTestCase(StorageDatabaseBaseCase):
 
     @users("dms-manager", "dms-user")
     def test_compute_thumbnail(self):
+        self.file_model._cron_generate_thumbnails()
         self.assertTrue(self.file_demo_01.image_128, "Thumbnail should be computed")
 
+    @users("dms-manager", "dms-user")
+    def test_generate_thumbnail(self):
+        buffer = io.BytesIO()
+        Image.new("RGB", (2400, 1200)).save(buffer, "PNG")
+        content = base64.b64encode(buffer.getvalue())
+        image_file = self.create_file(directory=self.directory, content=content)
+        # The upload returns before the thumbnail is generated
+        self.assertEqual(image_file.thumbnail_state, "pending")
+        self.assertFalse(image_file.image_128)
+        self.assertIn("/dms/static/icons/", image_file.icon_url)
+        self.assertFalse(self.file.thumbnail_state, "Not an image")
+        self.file_model._cron_generate_thumbnails()
+        self.assertEqual(image_file.thumbnail_state, "done")
+        self.assertTrue(image_file.image_128)
+        self.assertIn("image_128", image_file.icon_url)
+        self.assertEqual(
+            Image.open(io.BytesIO(base64.b64decode(image_file.image_1920))).size,
+            (1920, 960),
+        )
+        # The thumbnail is kept when the content is moved, not when it changes
+        image_file.sudo()._migrate_content()
+        self.assertEqual(image_file.thumbnail_state, "done")
+        image_file.content = content
+        self.assertEqual(image_file.thumbnail_state, "done")
+        buffer = io.BytesIO()
+        Image.new("RGB", (10, 10)).save(buffer, "PNG")
+        image_file.content = base64.b64encode(buffer.getvalue())
+        self.assertEqual(image_file.thumbnail_state, "pending")
+
+    @users("dms-manager", "dms-user")
+    def test_generate_thumbnail_duplicates(self):
+        buffer = io.BytesIO()
+        Image.new("RGB", (64, 64)).save(buffer, "PNG")
+        content = base64.b64encode(buffer.getvalue())
+        image_file = self.create_file(directory=self.directory, content=content)
+        duplicate = self.create_file(directory=self.directory2, content=content)
+        with patch.object(
+            thumbnail, "process_image", wraps=thumbnail.process_image
+        ) as process_image:
+            self.file_model._cron_generate_thumbnails()
+            self.assertEqual(process_image.call_count, 1)
+            self.assertEqual(duplicate.image_1920, image_file.image_1920)
+            # Uploaded again, the content reuses the generated thumbnail
+            other = self.create_file(directory=self.directory3, content=content)
+            self.file_model._cron_generate_thumbnails()
+            self.assertEqual(process_image.call_count, 1)
+        self.assertEqual(other.thumbnail_state, "done")
+        self.assertEqual(other.image_1920, image_file.image_1920)
+
+    @users("dms-manager", "dms-user")
+    def test_generate_preview(self):
+        buffer = io.BytesIO()
+        Image.new("RGB", (1357, 1920)).save(buffer, "PNG")
+        mimetypes = frozenset(["application/pdf"])
+        with (
+            patch.object(preview, "get_preview_mimetypes", return_value=mimetypes),
+            patch.object(
+                preview, "render_preview", return_value=buffer.getvalue()
+            ) as render_preview,
+        ):
+            pdf_file = self.create_file(
+                directory=self.directory,
+                content=base64.b64encode(b"%PDF-1.4 data"),
+            )
+            self.assertEqual(pdf_file.mimetype, "application/pdf")
+            self.assertEqual(pdf_file.thumbnail_state, "pending")
+            self.file_model._cron_generate_thumbnails()
+        render_preview.assert_called_once_with(
+            b"%PDF-1.4 data", "application/pdf", preview.PREVIEW_TIMEOUT
+        )
+        self.assertEqual(pdf_file.thumbnail_state, "done")
+        self.assertTrue(pdf_file.image_128)
+
+    @users("dms-manager", "dms-user")
+    def test_backfill_thumbnails(self):
+        buffer = io.BytesIO()
+        Image.new("RGB", (64, 64)).save(buffer, "PNG")
+        content = base64.b64encode(buffer.getvalue())
+        image_file = self.create_file(directory=self.directory, content=content)
+        # Stored before its thumbnail could be generated
+        image_file.sudo().thumbnail_state = False
+        self.file_model._cron_backfill_thumbnails()
+        self.assertEqual(image_file.thumbnail_state, "pending")
+        self.assertFalse(self.file.thumbnail_state, "Not an image")
+        self.file_model._cron_generate_thumbnails()
+        self.assertEqual(image_file.thumbnail_state, "done")
+
+    def test_icon_paths(self):
+        icon_paths = self.file_model._get_icon_paths()
+        names = os.listdir(file_path("dms/static/icons"))
+        self.assertEqual(set(icon_paths), set(names))
+        for name in names:
+            self.assertEqual(icon_paths[name], file_path(f"dms/static/icons/{name}"))
+            if name.startswith("file_"):
+                extension = name.removeprefix("file_").removesuffix(".svg")
+                dms_file = self.file_model.new({"name": f"icon.{extension}"})
+                self.assertEqual(
+                    dms_file.icon_url, f"/dms/static/icons/{name}?crop=1"
+                )
+        self.assertEqual(
+            self.file_model.new({"name": "icon.unknown-extension"}).icon_url,
+            "/dms/static/icons/file_unknown.svg?crop=1",
+        )
+        self.assertEqual(
+            self.directory.icon_url, "/dms/static/icons/folder.svg?crop=1"
+        )
+
+    def test_content_reader(self):
+        reader, size = self.file._get_content_reader()
+        self.assertEqual(size, len(base64.b64decode(self.content_base64())))
+        with reader:
+            # Every slice is read with a cursor of its own
+            content = reader.read(2) + reader.read()
+        self.assertEqual(content, base64.b64decode(self.content_base64()))
+
     @users("dms-manager", "dms-user")
     def test_compute_path_names(self):
         self.assertTrue(self.file.path_names, "Path names should be computed")
@@ -96,6 +233,23 @@ class FileDatabaseTestCase(StorageDatabaseBaseCase):
     def test_compute_path_json(self):
         self.assertTrue(self.file.path_json, "Path json should be computed")
 
+    @users("dms-manager", "dms-user")
+    def test_compute_path_nested(self):
+        directories = self.directory
+        for _index in range(3):
+            directories |= self.create_directory(directory=directories[-1])
+        files = self.create_file(directory=directories[-1]) | self.create_file(
+            directory=directories[1]
+        )
+        files.invalidate_recordset(["path_names", "path_json"])
+        for dms_file, path in zip(files, (directories, directories[:2]), strict=True):
+            names = path.mapped("name") + [dms_file.name]
+            self.assertEqual(dms_file.path_names, "/".join(names))
+            self.assertEqual(
+                [item["id"] for item in json.loads(dms_file.path_json)],
+                path.ids + [dms_file.id],
+            )
+
     @users("dms-manager", "dms-user")
     def test_compute_mimetype(self):
         self.assertTrue(self.file.mimetype, "Mimetype should be computed")
@@ -152,3 +306,43 @@ class FileDatabaseTestCase(StorageDatabaseBaseCase):
         )
         res = self.file.search_panel_select_range("directory_id", enable_counters=True)
         self.assertTrue(self.directory2.id == x["id"] for x in res["values"])
+
+    @users("dms-manager", "dms-user")
+    def test_bulk_create(self):
+        self.env["ir.config_parameter"].sudo().set_param(
+            "dms.forbidden_extensions", "exe"
+        )
+        directory = self.create_directory(storage=self.storage)
+        self.create_file(directory=directory).name = "used.txt"
+        vals_list = [
+            {"name": f"bulk-{index}.txt", "content_raw": b"bulk %d" % index}
+            for index in range(5)
+        ]
+        vals_list += [
+            {"name": "used.txt", "content_raw": b"duplicate"},
+            {"name": "bulk-0.txt", "content_raw": b"duplicate in batch"},
+            {"name": "forbidden.exe", "content_raw": b"forbidden"},
+            {"name": "invalid/name.txt", "content_raw": b"invalid"},
+        ]
+        for vals in vals_list:
+            vals["directory_id"] = directory.id
+        result = self.env["dms.file"].bulk_create(vals_list, batch_size=3)
+        self.assertEqual(len(result["ids"]), 5)
+        self.assertEqual([error["index"] for error in result["errors"]], [5, 6, 7, 8])
+        files = self.env["dms.file"].browse(result["ids"])
+        self.assertEqual(files.mapped("size"), [6.0] * 5)
+        self.assertEqual(files[0].checksum, files._get_checksum(b"bulk 0"))
+        self.assertEqual(directory.count_files, 6)
+        # A file failing alone in its batch is reported too
+        missing_directory = self.create_directory(storage=self.storage)
+        missing_directory_id = missing_directory.id
+        missing_directory.unlink()
+        result = self.env["dms.file"].bulk_create(
+            [
+                {"name": "bulk-ok.txt", "directory_id": directory.id},
+                {"name": "missing.txt", "directory_id": missing_directory_id},
+            ],
+            batch_size=1,
+        )
+        self.assertEqual(len(result["ids"]), 1)
+        self.assertEqual([error["index"] for error in result["errors"]], [1])
@@ -0,0 +1,70 @@
+# Copyright 2024 Subteno - Timothée Vannier (https://www.subteno.com).
+# License LGPL-3.0 or later (http://www.gnu.org/licenses/lgpl).
+
+import os
+import shutil
+import tempfile
+
+from odoo.tests.common import BaseCase
+
+from ..tools.file import NAME_MAX, check_name
+
+NAMES = [
+    "",
+    ".",
+    "..",
+    "...",
+    ".hidden",
+    "file",
+    "file.txt",
+    "file.tar.gz",
+    "file name with spaces.pdf",
+    " leading space",
+    "trailing space ",
+    "trailing dot.",
+    "tab\tand\nnew line",
+    "directory/file",
+    "directory/",
+    "nul\0byte",
+    "\0",
+    "back\\slash",
+    "colon:star*question?",
+    "<angle>|pipe",
+    '"quoted"',
+    "con",
+    "CON.txt",
+    "lpt1",
+    "日本語のファイル.pdf",
+    "émoji 📄.txt",
+    "x" * NAME_MAX,
+    "x" * (NAME_MAX + 1),
+    # Multibyte characters: the limit applies to the encoded name
+    "é" * (NAME_MAX // 2),
+    "é" * (NAME_MAX // 2 + 1),
+    "\udcff undecodable byte",
+]
+
+
+def check_name_reference(name):
+    """Previous implementation, creating the file in a temporary directory."""
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        open(os.path.join(tmp_dir, name), "a").close()
+    except (OSError, ValueError):
+        return False
+    finally:
+        shutil.rmtree(tmp_dir)
+    return True
+
+
+class FileNameTestCase(BaseCase):
+    def test_check_name_conformance(self):
+        for name in NAMES:
+            with self.subTest(name=name):
+                self.assertEqual(check_name(name), check_name_reference(name))
+
+    def test_check_name(self):
+        self.assertTrue(check_name("file.txt"))
+        for name in (False, "", ".", "..", "a/b", "a\0b", "x" * (NAME_MAX + 1)):
+            with self.subTest(name=name):
+                self.assertFalse(check_name(name))
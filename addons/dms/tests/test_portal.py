@@ -1,11 +1,15 @@
 # Copyright 2021-2025 Tecnativa - Víctor Martínez
 # License LGPL-3.0 or later (http://www.gnu.org/licenses/lgpl)
 
+import re
+from unittest.mock import patch
+
 import odoo.tests
 from odoo.exceptions import AccessError
 from odoo.tests.common import users
 from odoo.tools import mute_logger
 
+from ..controllers import portal
 from .common import StorageAttachmentBaseCase
 
 
@@ -43,6 +47,93 @@ class TestDmsPortal(odoo.tests.HttpCase, StorageAttachmentBaseCase):
             response.status_code, 200, "Can access directory with correct access_token"
         )
 
+    def test_download_file_stream(self):
+        self.authenticate("portal", "portal")
+        storage = self.create_storage(save_type="database")
+        directory = self.create_directory(storage=storage)
+        for dms_file in (self.file_partner, self.create_file(directory=directory)):
+            with self.subTest(save_type=dms_file.storage_id.save_type):
+                url = (
+                    f"{dms_file.access_url}"
+                    f"?access_token={dms_file.sudo()._portal_ensure_token()}"
+                )
+                response = self.url_open(url, timeout=20)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.content, b"\xff data")
+                etag = response.headers["ETag"]
+                self.assertIn(dms_file.checksum or "", etag)
+                # Range request
+                response = self.url_open(
+                    url, headers={"Range": "bytes=1-3"}, timeout=20
+                )
+                self.assertEqual(response.status_code, 206)
+                self.assertEqual(response.content, b" da")
+                # Conditional request
+                response = self.url_open(
+                    url, headers={"If-None-Match": etag}, timeout=20
+                )
+                self.assertEqual(response.status_code, 304)
+
+    def test_directory_pagination(self):
+        self.authenticate("portal", "portal")
+        storage = self.create_storage(save_type="database")
+        directory = self.create_directory(storage=storage)
+        for index in range(4):
+            self.create_directory(directory=directory).name = f"sub{index}"
+            self.create_file(directory=directory).name = f"file{index}.txt"
+        base_url = (
+            f"{directory.access_url}?access_token={directory._portal_ensure_token()}"
+        )
+        url = base_url
+        names = []
+        with patch.object(portal, "PORTAL_PAGE_SIZE", 3):
+            for _page in range(5):
+                response = self.url_open(url, timeout=20)
+                self.assertEqual(response.status_code, 200)
+                names += re.findall(r'link"\s+title="([^"]+)"', response.text)
+                cursor = re.search(r"after=(\d+-\d+)", response.text)
+                if not cursor:
+                    break
+                url = f"{base_url}&after={cursor.group(1)}"
+        # Every item is listed once, subdirectories first
+        expected = [f"sub{i}" for i in range(4)] + [f"file{i}.txt" for i in range(4)]
+        self.assertEqual(names, expected)
+
+    def test_directory_pagination_load_more(self):
+        self.authenticate("portal", "portal")
+        storage = self.create_storage(save_type="database")
+        directory = self.create_directory(storage=storage)
+        other_directory = self.create_directory(storage=storage)
+        for index in range(4):
+            self.create_directory(directory=directory).name = f"sub{index}"
+        other_file = self.create_file(directory=other_directory)
+        access_token = directory._portal_ensure_token()
+        base_url = f"{directory.access_url}?access_token={access_token}"
+        with patch.object(portal, "PORTAL_PAGE_SIZE", 3):
+            # A forged or stale cursor is ignored
+            for after in ("abc", "0-0", f"1-{other_file.id}", "7-1"):
+                response = self.url_open(f"{base_url}&after={after}", timeout=20)
+                self.assertEqual(response.status_code, 200)
+                names = re.findall(r'link"\s+title="([^"]+)"', response.text)
+                self.assertEqual(names, ["sub0", "sub1", "sub2"])
+            # The rows of the next page are rendered to be appended
+            cursor = re.search(r"after=(\d+-\d+)", response.text).group(1)
+            params = {
+                "after": cursor,
+                "dms_directory_id": directory.id,
+                "access_token": access_token,
+            }
+            result = self.make_jsonrpc_request("/my/dms/load_more", params)
+            names = re.findall(r'link"\s+title="([^"]+)"', result["html"])
+            self.assertEqual(names, ["sub3"])
+            self.assertFalse(result["next_cursor"])
+            # An invalid cursor or access token loads nothing
+            for values in ({"after": "0-0"}, {"access_token": "abc-def"}):
+                result = self.make_jsonrpc_request(
+                    "/my/dms/load_more", dict(params, **values)
+                )
+                self.assertEqual(result, {"html": "", "next_cursor": None})
+
     def test_tour(self):
         for tour in ("dms_portal_mail_tour", "dms_portal_partners_tour"):
             with self.subTest(tour=tour):
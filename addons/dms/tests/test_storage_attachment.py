@@ -3,6 +3,8 @@
 # Copyright 2024 Subteno - Timothée Vannier (https://www.subteno.com).
 # License LGPL-3.0 or later (http://www.gnu.org/licenses/lgpl).
 
+from unittest.mock import patch
+
 from odoo.tests.common import users
 from odoo.tools import mute_logger
 
@@ -35,6 +37,70 @@ class StorageAttachmentTestCase(StorageAttachmentBaseCase):
         self.assertFalse(file_01.exists(), "File should not exist")
         self.assertFalse(directory.exists(), "Directory should not exist")
 
+    @users("dms-manager")
+    def test_storage_attachment_batch(self):
+        partners = self.partner_model.create([{"name": "p1"}, {"name": "p2"}])
+        attachments = self.attachment_model.create(
+            [
+                {
+                    "name": f"batch{index}.txt",
+                    "res_model": partner._name,
+                    "res_id": partner.id,
+                    "datas": self.content_base64(),
+                }
+                for partner in partners
+                for index in range(3)
+            ]
+        )
+        # Processing the attachments again does not duplicate anything
+        attachments._dms_operations()
+        attachments_by_partner = attachments.grouped("res_id")
+        for partner in partners:
+            directory = self._get_partner_directory(partner)
+            self.assertEqual(len(directory), 1)
+            self.assertEqual(directory.name, partner.display_name)
+            self.assertEqual(
+                sorted(directory.file_ids.mapped("name")),
+                ["batch0.txt", "batch1.txt", "batch2.txt"],
+            )
+            self.assertEqual(
+                directory.file_ids.attachment_id, attachments_by_partner[partner.id]
+            )
+
+    def test_storage_attachment_linked_models(self):
+        directory_model = self.env["dms.directory"]
+        self.assertIn(self.partner._name, directory_model._get_linked_models())
+        self.assertNotIn("res.partner.category", directory_model._get_linked_models())
+        # Linking a storage to another model refreshes the linked models
+        self.storage.model_ids |= self.env.ref("base.model_res_partner_category")
+        self.assertIn("res.partner.category", directory_model._get_linked_models())
+        # Records of the linked models still remove their documents
+        self._create_attachment("demo.txt")
+        directory = self._get_partner_directory()
+        self.partner.unlink()
+        self.assertFalse(directory.exists())
+
+    def test_storage_attachment_deferred(self):
+        self.env["ir.config_parameter"].sudo().set_param(
+            "dms.attachment_sync_mode", "deferred"
+        )
+        queue = self.env["dms.attachment.queue"]
+        attachment = self._create_attachment("demo.txt")
+        self.assertFalse(self._get_partner_directory().file_ids)
+        # Enqueuing the attachment again does not duplicate it
+        queue._enqueue(attachment)
+        self.assertEqual(queue.search([]).attachment_id, attachment)
+        self.assertEqual(queue._get_backlog()[:2], (1, 0))
+        self.assertEqual(queue._process(), 1)
+        self.assertEqual(self._get_partner_directory().file_ids.name, "demo.txt")
+        self.assertFalse(queue.search([]))
+        self.assertEqual(queue._get_backlog()[:2], (0, 0))
+        # The entries are processed by batches
+        self._create_attachment("demo2.txt")
+        self._create_attachment("demo3.txt")
+        self.assertEqual(queue._process(batch_size=1), 2)
+        self.assertEqual(len(self._get_partner_directory().file_ids), 3)
+
     @users("dms-manager")
     def test_storage_attachment_record_db_unlink(self):
         self._create_attachment("demo.txt")
@@ -48,6 +114,21 @@ class StorageAttachmentTestCase(StorageAttachmentBaseCase):
         directories = self.env["dms.directory"].search([])
         self.assertNotIn(directory.id, directories.ids)
 
+    @users("dms-manager")
+    def test_storage_attachment_inherited_access_subquery(self):
+        self.env["ir.config_parameter"].sudo().set_param(
+            "dms.inherited_access_mode", "subquery"
+        )
+        self._create_attachment("demo.txt")
+        directory = self._get_partner_directory()
+        directories = self.env["dms.directory"].search([])
+        self.assertIn(directory.id, directories.ids)
+        self.assertTrue(directory.permission_read)
+        self.assertIn(directory.file_ids.id, self.env["dms.file"].search([]).ids)
+        directory.res_id = -1  # Trick to reference a non-existing record
+        directories = self.env["dms.directory"].search([])
+        self.assertNotIn(directory.id, directories.ids)
+
     @mute_logger("odoo.models.unlink")
     def test_storage_attachment_unlink_lock_file(self):
         group_partner_manager = self.env.ref("base.group_partner_manager")
@@ -166,3 +247,17 @@ class StorageAttachmentTestCase(StorageAttachmentBaseCase):
         attachment = self._create_attachment("Test file")
         self.assertEqual(attachment.name, "Test file", "Name should be Test file")
         self.assertTrue(self._get_partner_directory(), "Directory should exist")
+
+    @users("basic-user")
+    def test_own_root_directories_inherited_access(self):
+        self._create_attachment("demo.txt")
+        directory_model = self.env["dms.directory"]
+        # The access inherited from the partners is not cached
+        with patch.object(
+            type(directory_model), "_get_own_root_directory_ids"
+        ) as cached_roots:
+            root_ids = directory_model._get_own_root_directories()
+        cached_roots.assert_not_called()
+        visible = directory_model.search([("is_hidden", "=", False)])
+        expected = visible.filtered(lambda d: d.parent_id not in visible)
+        self.assertEqual(set(root_ids), set(expected.ids))
@@ -10,10 +10,101 @@ from .common import StorageDatabaseBaseCase
 
 
 class StorageDatabaseTestCase(StorageDatabaseBaseCase):
+    def _storage_migrate(self):
+        """Start the migration of the storage and run it as the scheduled action
+        would."""
+        self.storage.action_storage_migrate()
+        self.env["dms.storage.migration"].sudo()._cron_run()
+
     @users("dms-manager")
     def test_action_storage_migrate(self):
         self.storage.action_storage_migrate()
 
+    @users("dms-manager")
+    @mute_logger("odoo.models.unlink")
+    def test_storage_migration(self):
+        directory = self.create_directory(storage=self.storage)
+        files = self.create_file(directory=directory) | self.create_file(
+            directory=directory
+        )
+        empty_file = self.file_model.create(
+            {"name": "empty.txt", "directory_id": directory.id, "content_raw": b""}
+        )
+        self.storage.write({"save_type": "file"})
+        # An empty content has nothing to migrate
+        self.assertFalse(empty_file.require_migration)
+        self.storage.action_storage_migrate()
+        migration = self.env["dms.storage.migration"].search(
+            [("storage_id", "=", self.storage.id)]
+        )
+        self.assertEqual(migration.state, "pending")
+        # Starting again does not create another migration
+        self._storage_migrate()
+        self.assertEqual(
+            self.env["dms.storage.migration"].search_count(
+                [("storage_id", "=", self.storage.id)]
+            ),
+            1,
+        )
+        migration.batch_size = 1
+        migration.sudo()._run()
+        self.assertEqual(migration.state, "done")
+        self.assertEqual(migration.done_count, migration.file_count)
+        self.assertEqual(migration.progress, 100.0)
+        self.assertGreater(migration.done_size, 0)
+        self.assertFalse(migration.failed_file_ids)
+        for dms_file in files:
+            self.assertEqual(dms_file.save_type, "file")
+            self.assertFalse(dms_file.require_migration)
+            self.assertEqual(dms_file.content, self.content_base64())
+            # The content was streamed to the filestore path of its checksum
+            self.assertFalse(dms_file.content_binary)
+            self.assertEqual(
+                dms_file._get_content_attachment().store_fname,
+                f"{dms_file.checksum[:2]}/{dms_file.checksum}",
+            )
+
+    @users("dms-manager")
+    def test_storage_migration_time_budget(self):
+        directory = self.create_directory(storage=self.storage)
+        dms_file = self.create_file(directory=directory)
+        self.storage.write({"save_type": "file"})
+        self.storage.action_storage_migrate()
+        migration_model = self.env["dms.storage.migration"].sudo()
+        # Without time left, the migration is resumed by the next run
+        migration_model._cron_run(time_budget=0)
+        migration = migration_model.search([("storage_id", "=", self.storage.id)])
+        self.assertEqual(migration.state, "running")
+        self.assertTrue(dms_file.require_migration)
+        migration_model._cron_run()
+        self.assertEqual(migration.state, "done")
+        self.assertFalse(dms_file.require_migration)
+
+    @users("dms-manager")
+    def test_storage_migration_direct(self):
+        directory = self.create_directory(storage=self.storage)
+        files = self.create_file(directory=directory) | self.create_file(
+            directory=directory
+        )
+        # The save type is read before the files are migrated
+        self.assertEqual(files.mapped("save_type"), ["database"] * 2)
+        self.storage.write({"save_type": "file"})
+        self.assertTrue(all(files.mapped("require_migration")))
+        files.sudo()._migrate_contents()
+        self.assertEqual(files.mapped("save_type"), ["file"] * 2)
+        self.assertFalse(any(files.mapped("require_migration")))
+        self.storage.write({"save_type": "database"})
+        self._storage_migrate()
+        self.storage.write({"save_type": "file"})
+        self._storage_migrate()
+        migration = self.env["dms.storage.migration"].search(
+            [("storage_id", "=", self.storage.id)], limit=1
+        )
+        self.assertEqual(migration.state, "done")
+        self.assertEqual(migration.done_count, len(files))
+        self.assertFalse(migration.failed_file_ids)
+        self.assertFalse(any(files.mapped("require_migration")))
+
     @users("dms-manager", "dms-user")
     def test_count_storage_directories(self):
         self.assertTrue(
@@ -55,7 +146,7 @@ class StorageDatabaseTestCase(StorageDatabaseBaseCase):
         )
         self.assertEqual(file_02.storage_id.save_type, "file", "Storage should be file")
         self.assertEqual(file_02.save_type, "file", "File savetype should be file")
-        self.storage.action_storage_migrate()
+        self._storage_migrate()
         self.assertEqual(
             file_01.storage_id, self.storage, "File should be in the storage"
         )
@@ -67,7 +158,7 @@ class StorageDatabaseTestCase(StorageDatabaseBaseCase):
         self.assertEqual(file_02.storage_id.save_type, "file", "Storage should be file")
         self.assertEqual(file_02.save_type, "file", "File savetype should be file")
         self.storage.write({"save_type": "database"})
-        self.storage.action_storage_migrate()
+        self._storage_migrate()
         self.assertEqual(
             file_01.storage_id, self.storage, "File should be in the storage"
         )
@@ -117,7 +208,7 @@ class StorageDatabaseTestCase(StorageDatabaseBaseCase):
         self.assertEqual(
             file_03.save_type, "database", "File savetype should be database"
         )
-        self.storage.action_storage_migrate()
+        self._storage_migrate()
         self.assertEqual(
             file_02.storage_id, self.storage, "File should be in the storage"
         )
@@ -136,3 +227,26 @@ class StorageDatabaseTestCase(StorageDatabaseBaseCase):
         self.assertEqual(
             file_03.save_type, "database", "File savetype should be database"
         )
+
+    @users("dms-manager")
+    @mute_logger("odoo.models.unlink")
+    def test_deduplicate_content(self):
+        for save_type in ("database", "file"):
+            with self.subTest(save_type=save_type):
+                storage = self.create_storage(save_type=save_type)
+                storage.deduplicate_content = True
+                directory = self.create_directory(storage=storage)
+                other_directory = self.create_directory(storage=storage)
+                file_01 = self.create_file(directory=directory)
+                file_02 = self.create_file(directory=other_directory)
+                blob = file_01.blob_id
+                self.assertTrue(blob, "Content should be stored in a blob")
+                self.assertEqual(file_02.blob_id, blob, "Content should be shared")
+                self.assertEqual(blob.sudo().ref_count, 2)
+                self.assertEqual(file_02.content, self.content_base64())
+                self.assertEqual(file_02.save_type, save_type)
+                self.assertFalse(file_02.content_binary or file_02.content_file)
+                file_01.unlink()
+                self.assertTrue(blob.exists(), "Blob is still referenced")
+                file_02.unlink()
+                self.assertFalse(blob.exists(), "Unreferenced blob is deleted")
@@ -1 +1,4 @@
 from . import file
+from . import preview
+from . import stream
+from . import thumbnail
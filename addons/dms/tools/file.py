@@ -6,30 +6,51 @@
 import mimetypes
 import os
 import re
-import shutil
-import tempfile
 
 from odoo.tools.mimetypes import guess_mimetype
 
+# Maximum length of a file name, in bytes, on most file systems
+NAME_MAX = 255
+
+WINDOWS_RESERVED_CHARS = re.compile(r'[<>:"/\\|?*\x00-\x1f]')
+WINDOWS_RESERVED_NAMES = frozenset(
+    ["CON", "PRN", "AUX", "NUL"]
+    + [f"COM{index}" for index in range(1, 10)]
+    + [f"LPT{index}" for index in range(1, 10)]
+)
+
 
 def check_name(name):
     """
     Check if a file name is valid.
 
+    The name is checked in memory against the rules of the file system: it must
+    be a single path component, without NUL byte, that fits in the maximum name
+    length. On Windows, the reserved characters and device names are rejected too.
+
     :param str name: The file name to check.
     :return: True if the file name is valid, False otherwise.
     :rtype: bool
     """
-    tmp_dir = tempfile.mkdtemp()
+    if not name or name in (".", "..") or "/" in name or "\0" in name:
+        return False
     try:
-        open(os.path.join(tmp_dir, name), "a").close()
-    except OSError:
+        length = len(os.fsencode(name))
+    except UnicodeError:
         return False
-    finally:
-        shutil.rmtree(tmp_dir)
+    if length > NAME_MAX:
+        return False
+    if os.name == "nt":
+        return _check_windows_name(name)
     return True
 
 
+def _check_windows_name(name):
+    if WINDOWS_RESERVED_CHARS.search(name) or name[-1] in (" ", "."):
+        return False
+    return name.split(".")[0].strip().upper() not in WINDOWS_RESERVED_NAMES
+
+
 def compute_name(name, suffix, escape_suffix):
     """
     Compute a new name by adding a suffix to the original name.
@@ -0,0 +1,133 @@
+# Copyright 2024 Subteno - Timothée Vannier (https://www.subteno.com).
+# License LGPL-3.0 or later (http://www.gnu.org/licenses/lgpl).
+
+import functools
+import os
+import signal
+import subprocess
+import tempfile
+
+from odoo.tools.misc import find_in_path
+
+# Maximum duration of the rendering of a preview, in seconds
+PREVIEW_TIMEOUT = 60
+
+PDF_MIMETYPE = "application/pdf"
+OFFICE_MIMETYPES = frozenset(
+    [
+        "application/msword",
+        "application/vnd.ms-excel",
+        "application/vnd.ms-powerpoint",
+        "application/vnd.oasis.opendocument.presentation",
+        "application/vnd.oasis.opendocument.spreadsheet",
+        "application/vnd.oasis.opendocument.text",
+        "application/vnd.openxmlformats-officedocument.presentationml.presentation",
+        "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+        "application/rtf",
+    ]
+)
+
+
+@functools.cache
+def _find_program(name):
+    try:
+        return find_in_path(name)
+    except OSError:
+        return None
+
+
+@functools.cache
+def get_preview_mimetypes():
+    """
+    Get the mimetypes of the documents a preview can be rendered from, given
+    the programs installed: ``pdftoppm`` for PDF documents, and ``soffice`` for
+    office documents.
+
+    :return: The mimetypes.
+    :rtype: frozenset[str]
+    """
+    if not _find_program("pdftoppm"):
+        return frozenset()
+    if not _find_program("soffice"):
+        return frozenset([PDF_MIMETYPE])
+    return OFFICE_MIMETYPES | {PDF_MIMETYPE}
+
+
+def is_previewable(mimetype):
+    return mimetype in get_preview_mimetypes()
+
+
+def _run(args, timeout):
+    """Run a program, killing it with all its children when it times out."""
+    with subprocess.Popen(
+        args,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        start_new_session=True,
+    ) as process:
+        try:
+            __, error = process.communicate(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            os.killpg(process.pid, signal.SIGKILL)
+            process.wait()
+            raise
+        if process.returncode:
+            raise subprocess.CalledProcessError(
+                process.returncode, args, stderr=error
+            )
+
+
+def render_preview(raw, mimetype, timeout=PREVIEW_TIMEOUT):
+    """
+    Render the first page of a document as a PNG image, fitting in the size of
+    the largest image of the image mixin. Run in the worker threads generating
+    the thumbnails.
+
+    :param bytes raw: The raw content of the document.
+    :param str mimetype: The mimetype of the document.
+    :param int timeout: The maximum duration of each rendering step, in seconds.
+
+    :return: The raw content of the image.
+    :rtype: bytes
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        source = os.path.join(directory, "source")
+        with open(source, "wb") as source_file:
+            source_file.write(raw)
+        if mimetype in OFFICE_MIMETYPES:
+            # A profile of its own lets several conversions run in parallel
+            _run(
+                [
+                    _find_program("soffice"),
+                    "--headless",
+                    "--norestore",
+                    f"-env:UserInstallation=file://{directory}/profile",
+                    "--convert-to",
+                    "pdf",
+                    "--outdir",
+                    directory,
+                    source,
+                ],
+                timeout,
+            )
+            source = f"{source}.pdf"
+        output = os.path.join(directory, "preview")
+        _run(
+            [
+                _find_program("pdftoppm"),
+                "-png",
+                "-f",
+                "1",
+                "-l",
+                "1",
+                "-singlefile",
+                "-scale-to",
+                "1920",
+                source,
+                output,
+            ],
+            timeout,
+        )
+        with open(f"{output}.png", "rb") as preview_file:
+            return preview_file.read()
@@ -0,0 +1,92 @@
+# Copyright 2024 Subteno - Timothée Vannier (https://www.subteno.com).
+# License LGPL-3.0 or later (http://www.gnu.org/licenses/lgpl).
+
+import io
+
+from odoo.tools import SQL
+
+# Size of the slices read from the filestore or the database when streaming
+CHUNK_SIZE = 1024 * 1024
+
+
+class DatabaseBinaryReader(io.RawIOBase):
+    """
+    Read-only and seekable file object over a bytea column of a single row.
+
+    The content is fetched lazily in slices with ``substring``. Each slice is
+    read with a short-lived cursor of its own: the response body is consumed
+    once the request cursor is closed, and a slow client must not hold a
+    connection and an open transaction until it is done. Reading fails if the
+    size of the content changed in the meantime. A cursor can be given instead
+    to read content not committed yet, in which case it is left open.
+
+    :param odoo.modules.registry.Registry registry: The registry of the database.
+    :param str table: The table holding the content.
+    :param str column: The bytea column holding the content.
+    :param int res_id: The id of the row holding the content.
+    :param int size: The size of the content, in bytes.
+    :param odoo.sql_db.Cursor cr: The cursor to read the content with, if any.
+    """
+
+    def __init__(self, registry, table, column, res_id, size, cr=None):
+        super().__init__()
+        self._registry = registry
+        self._table = table
+        self._column = column
+        self._res_id = res_id
+        self._size = size
+        self._position = 0
+        self._cr = cr
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += self._size
+        if offset < 0:
+            raise ValueError("Negative seek position %d" % offset)
+        self._position = offset
+        return self._position
+
+    def readinto(self, buffer):
+        length = min(len(buffer), self._size - self._position)
+        if length <= 0:
+            return 0
+        query = SQL(
+            """
+            SELECT substring(%(column)s FROM %(start)s FOR %(length)s),
+                octet_length(%(column)s)
+            FROM %(table)s WHERE id = %(id)s
+            """,
+            column=SQL.identifier(self._column),
+            start=self._position + 1,
+            length=length,
+            table=SQL.identifier(self._table),
+            id=self._res_id,
+        )
+        if self._cr is not None:
+            self._cr.execute(query)
+            row = self._cr.fetchone()
+        else:
+            with self._registry.cursor() as cr:
+                cr.execute(query)
+                row = cr.fetchone()
+        if not row or (row[1] or 0) != self._size:
+            raise OSError(f"The content of the row {self._res_id} changed")
+        chunk = bytes(row[0]) if row[0] else b""
+        buffer[: len(chunk)] = chunk
+        self._position += len(chunk)
+        return len(chunk)
+
+    def close(self):
+        self._cr = None
+        super().close()
@@ -0,0 +1,45 @@
+# Copyright 2024 Subteno - Timothée Vannier (https://www.subteno.com).
+# License LGPL-3.0 or later (http://www.gnu.org/licenses/lgpl).
+
+import functools
+
+from PIL import Image
+
+from odoo.tools.image import image_process
+
+# Size of the largest image of the image mixin
+IMAGE_SIZE = (1920, 1920)
+
+
+@functools.cache
+def get_image_mimetypes():
+    """
+    Get the mimetypes of the images a thumbnail can be generated from.
+
+    The mimetypes supported by Pillow are only known once all its plugins are
+    loaded, so the set is built on first use. SVG is not supported by Pillow but
+    is a supported image format, while PDF is added by some components and must
+    be excluded.
+
+    :return: The mimetypes.
+    :rtype: frozenset[str]
+    """
+    Image.init()
+    return frozenset({*Image.MIME.values(), "image/svg+xml"} - {"application/pdf"})
+
+
+def is_image(mimetype):
+    return mimetype in get_image_mimetypes()
+
+
+def process_image(raw):
+    """
+    Downscale an image to the size of the largest image of the image mixin. Run
+    in the worker threads generating the thumbnails.
+
+    :param bytes raw: The raw content of the image.
+
+    :return: The raw content of the downscaled image.
+    :rtype: bytes
+    """
+    return image_process(raw, size=IMAGE_SIZE, verify_resolution=True)